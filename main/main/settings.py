@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third-party apps
     'django_bootstrap5',
     'crispy_forms',
@@ -177,5 +178,29 @@ EMAIL_TIMEOUT = 30  # Timeout in seconds
 # For development/testing (prints to console instead of sending):
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Cache - availability answers and calendars are cached per product and
+# invalidated by bumping a version key, and the cart badge count is dropped
+# when the cart changes. Both only reach other worker processes through a
+# shared backend: with local memory every process bumps and drops entries in
+# its own cache only, so other workers keep serving stale availability until
+# the entries expire. Local memory is for a single development process; with
+# more than one worker use Redis, Memcached or the database cache, e.g.
+# 'django.core.cache.backends.redis.RedisCache' with a LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rentease',
+    }
+}
+
 # Session settings
 SESSION_COOKIE_AGE = 86400  # 1 day
+
+# Cart holds - minutes a cart line reserves stock before checkout (0 disables holds)
+CART_HOLD_MINUTES = 15
+
+# Idempotency keys - how long a finished checkout/payment POST is remembered for retries
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+# Seconds a running POST holds its key. A retry after that takes the key over, so a
+# worker killed mid-request does not block it for a day; keep above the request timeout
+IDEMPOTENCY_CLAIM_LEASE_SECONDS = 60
@@ -3,7 +3,7 @@ from django.utils.html import format_html
 from .models import (
     Category, ProductAttribute, AttributeValue, Product, ProductImage, ProductVariant,
     Quotation, QuotationLine, RentalOrder, OrderLine,
-    Pickup, Return, Invoice, Payment, SystemSettings
+    Pickup, Return, Invoice, Payment, SystemSettings, Job, VendorStats, DailySalesRollup
 )
 
 
@@ -192,3 +192,21 @@ class SystemSettingsAdmin(admin.ModelAdmin):
     list_display = ['key', 'value', 'description']
     search_fields = ['key', 'description']
 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'attempts', 'max_attempts', 'run_at', 'updated_at']
+    list_filter = ['status', 'task']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(VendorStats)
+class VendorStatsAdmin(admin.ModelAdmin):
+    list_display = ['vendor', 'total_products', 'total_orders', 'active_rentals', 'total_revenue', 'pending_revenue', 'updated_at']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'vendor', 'status', 'order_count', 'invoice_count', 'revenue']
+    list_filter = ['status', 'date']
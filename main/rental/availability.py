@@ -0,0 +1,368 @@
+"""
+Availability engine for rentable products.
+
+Reservations are half-open intervals [start_date, end_date), also stored as a
+tstzrange `period` column so overlap lookups (&&) are served by GiST indexes.
+Instead of adding up every booking that touches a window, we sweep over the
+sorted start/end events of the overlapping bookings and keep the peak number
+of units that are out at the same instant. Two bookings that never overlap
+each other therefore only count once against the window.
+
+Stock is tracked per "stock key" (product_id, variant_id): a booking of a
+variant consumes that variant's quantity_on_hand, a booking without a variant
+consumes the product's own quantity_on_hand.
+
+When CART_HOLD_MINUTES is set, unexpired cart lines (QuotationLine holds)
+count as bookings too, so a customer does not lose an item between adding it
+to the cart and checking out.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product, ProductVariant, QuotationLine, OrderLine, rental_period
+
+
+# Order statuses that hold stock against a date window
+ACTIVE_ORDER_STATUSES = ['confirmed', 'picked_up', 'rented']
+
+# Calendar resolutions exposed to the product page
+CALENDAR_STEPS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Timeouts only bound entries no version bump reaches; bumps reach other
+# processes only through a shared cache backend (see CACHES in settings)
+CALENDAR_CACHE_TIMEOUT = 60 * 60
+
+# Kept short because cart holds expire by time rather than by a booking change
+AVAILABILITY_CACHE_TIMEOUT = 5 * 60
+
+
+def peak_concurrent_quantity(intervals, start_date, end_date):
+    """
+    Return the highest total quantity booked at any instant of the window.
+
+    `intervals` is an iterable of (start, end, quantity) tuples. Each interval
+    is clipped to the window before sweeping. Ends are processed before starts
+    at the same timestamp, so back-to-back bookings do not stack.
+    """
+    events = []
+    for line_start, line_end, quantity in intervals:
+        line_start = max(line_start, start_date)
+        line_end = min(line_end, end_date)
+        if line_start >= line_end:
+            continue
+        events.append((line_start, quantity))
+        events.append((line_end, -quantity))
+
+    # Tuples sort by timestamp, then delta: releases (-q) before bookings (+q)
+    events.sort()
+
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        if current > peak:
+            peak = current
+    return peak
+
+
+def get_hold_duration():
+    """How long a cart line holds stock, or None when cart holds are disabled"""
+    minutes = getattr(settings, 'CART_HOLD_MINUTES', 0)
+    return timedelta(minutes=minutes) if minutes else None
+
+
+def active_holds(start_date, end_date):
+    """Unexpired cart holds overlapping the window (served by the partial hold index)"""
+    return QuotationLine.objects.filter(
+        hold_expires_at__isnull=False,
+        hold_expires_at__gt=timezone.now(),
+        period__overlap=rental_period(start_date, end_date)
+    )
+
+
+def get_stock_quantity(product, variant=None):
+    """Units owned for a stock key - the variant's own stock if one is given"""
+    return variant.quantity_on_hand if variant else product.quantity_on_hand
+
+
+def overlapping_intervals(product, start_date, end_date, exclude_line_id=None, exclude_hold_id=None, variant=None):
+    """Fetch (start, end, quantity) rows for active bookings of one stock key overlapping the window"""
+    lines = OrderLine.objects.filter(
+        product=product,
+        variant=variant,
+        order__status__in=ACTIVE_ORDER_STATUSES,
+        period__overlap=rental_period(start_date, end_date)
+    )
+    if exclude_line_id:
+        lines = lines.exclude(id=exclude_line_id)
+    lines = lines.values_list('start_date', 'end_date', 'quantity')
+
+    if get_hold_duration():
+        holds = active_holds(start_date, end_date).filter(product=product, variant=variant)
+        if exclude_hold_id:
+            holds = holds.exclude(id=exclude_hold_id)
+        lines = lines.union(holds.values_list('start_date', 'end_date', 'quantity'), all=True)
+    return lines
+
+
+def overlapping_intervals_by_stock_key(product_ids, start_date, end_date, exclude_quotation_id=None):
+    """
+    Active bookings overlapping the window for many products, in one query.
+
+    Returns {(product_id, variant_id): [(start, end, quantity), ...]}.
+    """
+    intervals_by_key = defaultdict(list)
+    rows = OrderLine.objects.filter(
+        product_id__in=product_ids,
+        order__status__in=ACTIVE_ORDER_STATUSES,
+        period__overlap=rental_period(start_date, end_date)
+    ).values_list('product_id', 'variant_id', 'start_date', 'end_date', 'quantity')
+
+    if get_hold_duration():
+        holds = active_holds(start_date, end_date).filter(product_id__in=product_ids)
+        if exclude_quotation_id:
+            holds = holds.exclude(quotation_id=exclude_quotation_id)
+        rows = rows.union(
+            holds.values_list('product_id', 'variant_id', 'start_date', 'end_date', 'quantity'),
+            all=True
+        )
+
+    for product_id, variant_id, line_start, line_end, quantity in rows:
+        intervals_by_key[(product_id, variant_id)].append((line_start, line_end, quantity))
+    return intervals_by_key
+
+
+def get_reserved_quantity(product, start_date, end_date, exclude_line_id=None, exclude_hold_id=None, variant=None):
+    """
+    Peak number of units reserved at the same time within the window.
+
+    Plain questions (no exclusions) are cached under the product's
+    availability version, so the product page, AddToCartForm.clean and
+    QuotationLine.clean share one computation until the next booking change.
+    """
+    if exclude_line_id or exclude_hold_id:
+        intervals = overlapping_intervals(
+            product, start_date, end_date, exclude_line_id, exclude_hold_id, variant
+        )
+        return peak_concurrent_quantity(intervals, start_date, end_date)
+
+    version = get_availability_version(product.pk)
+    cache_key = (
+        f'availability_reserved:{product.pk}:{variant.pk if variant else ""}:{version}:'
+        f'{start_date.isoformat()}:{end_date.isoformat()}'
+    )
+    reserved = cache.get(cache_key)
+    if reserved is None:
+        intervals = overlapping_intervals(product, start_date, end_date, variant=variant)
+        reserved = peak_concurrent_quantity(intervals, start_date, end_date)
+        cache.set(cache_key, reserved, AVAILABILITY_CACHE_TIMEOUT)
+    return reserved
+
+
+def get_available_quantity(product, start_date, end_date, exclude_line_id=None, exclude_hold_id=None, variant=None):
+    """Units of `product` (or of one of its variants) that are free for the whole window"""
+    reserved = get_reserved_quantity(
+        product, start_date, end_date, exclude_line_id, exclude_hold_id, variant
+    )
+    return max(0, get_stock_quantity(product, variant) - reserved)
+
+
+def get_stock_key_availability(product_ids, start_date, end_date):
+    """
+    Batched availability for every stock key of many products over one window.
+
+    Returns {(product_id, variant_id): available quantity}, with variant_id
+    None for the product's own stock. Product stock, variant stock and all
+    overlapping bookings are each fetched in a single query, grouped in
+    memory and swept per stock key.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+
+    stock = {
+        (product_id, None): quantity_on_hand
+        for product_id, quantity_on_hand in Product.objects.filter(
+            id__in=product_ids
+        ).values_list('id', 'quantity_on_hand')
+    }
+    stock.update({
+        (product_id, variant_id): quantity_on_hand
+        for variant_id, product_id, quantity_on_hand in ProductVariant.objects.filter(
+            product_id__in=product_ids
+        ).values_list('id', 'product_id', 'quantity_on_hand')
+    })
+
+    intervals_by_key = overlapping_intervals_by_stock_key(product_ids, start_date, end_date)
+
+    available = {}
+    for stock_key, quantity_on_hand in stock.items():
+        reserved = peak_concurrent_quantity(
+            intervals_by_key.get(stock_key, ()), start_date, end_date
+        )
+        available[stock_key] = max(0, quantity_on_hand - reserved)
+    return available
+
+
+def get_available_quantities(product_ids, start_date, end_date):
+    """
+    Batched availability for many products over one window.
+
+    Returns {product_id: available quantity}, counting the product's own
+    free stock plus the free stock of all its variants.
+    """
+    available = defaultdict(int)
+    for (product_id, _), quantity in get_stock_key_availability(product_ids, start_date, end_date).items():
+        available[product_id] += quantity
+    return dict(available)
+
+
+def find_shortages(lines, products, variants=None, exclude_quotation_id=None):
+    """
+    Re-validate cart lines against the bookings that exist right now.
+
+    `products` and `variants` map ids to Product / ProductVariant rows,
+    normally locked with select_for_update() by the caller. Lines for the
+    same stock key are checked together, so two cart lines cannot both claim
+    the last unit. Holds of
+    `exclude_quotation_id` (the cart being checked out) are not counted
+    against itself. Returns a list of (product, available) for every product
+    that no longer fits.
+    """
+    variants = variants or {}
+    lines_by_key = defaultdict(list)
+    for line in lines:
+        lines_by_key[(line.product_id, line.variant_id)].append(line)
+    if not lines_by_key:
+        return []
+
+    window_start = min(line.start_date for line in lines)
+    window_end = max(line.end_date for line in lines)
+    intervals_by_key = overlapping_intervals_by_stock_key(
+        {product_id for product_id, _ in lines_by_key}, window_start, window_end,
+        exclude_quotation_id
+    )
+
+    shortages = []
+    for (product_id, variant_id), key_lines in lines_by_key.items():
+        product = products[product_id]
+        quantity_on_hand = get_stock_quantity(product, variants.get(variant_id))
+        booked = intervals_by_key.get((product_id, variant_id), [])
+        requested = [(line.start_date, line.end_date, line.quantity) for line in key_lines]
+        for line in key_lines:
+            peak = peak_concurrent_quantity(booked + requested, line.start_date, line.end_date)
+            if peak > quantity_on_hand:
+                reserved = peak_concurrent_quantity(booked, line.start_date, line.end_date)
+                shortages.append((product, max(0, quantity_on_hand - reserved)))
+                break
+    return shortages
+
+
+def get_availability_version(product_id):
+    """
+    Current cache version token for a product's bookings.
+
+    A fresh random token (rather than a counter) is used so that an evicted
+    version key can never come back with a value that old entries were
+    cached under.
+    """
+    key = f'availability_version:{product_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_availability_version(*product_ids):
+    """
+    Invalidate every cached availability answer for the given products.
+
+    Called from the booking signal handlers, i.e. before the change is
+    committed. A reader in between could cache the old state under the new
+    version, so the version is bumped once more after the commit.
+    """
+    def bump():
+        cache.set_many(
+            {f'availability_version:{product_id}': uuid.uuid4().hex for product_id in product_ids},
+            None
+        )
+
+    if product_ids:
+        bump()
+        transaction.on_commit(bump)
+
+
+def build_availability_timeline(quantity_on_hand, intervals, start_date, end_date, step):
+    """
+    Free quantity per slot of `step` between start_date and end_date.
+
+    One sweep over the sorted booking events: between two consecutive events
+    the booked level is constant, so it only has to be applied to the slots
+    that segment covers. Returns a list of (slot_start, free_quantity).
+    """
+    slot_count = -((start_date - end_date) // step)
+    peaks = [0] * slot_count
+
+    events = []
+    for line_start, line_end, quantity in intervals:
+        line_start = max(line_start, start_date)
+        line_end = min(line_end, end_date)
+        if line_start >= line_end:
+            continue
+        events.append((line_start, quantity))
+        events.append((line_end, -quantity))
+    events.sort()
+
+    current = 0
+    segment_start = start_date
+    for time, delta in events:
+        if current > 0 and time > segment_start:
+            first = (segment_start - start_date) // step
+            last = min((time - start_date - timedelta(microseconds=1)) // step, slot_count - 1)
+            for slot in range(first, last + 1):
+                if current > peaks[slot]:
+                    peaks[slot] = current
+        current += delta
+        segment_start = time
+
+    return [
+        (start_date + step * slot, max(0, quantity_on_hand - peak))
+        for slot, peak in enumerate(peaks)
+    ]
+
+
+def get_availability_calendar(product, start_date, days, resolution='day', variant=None):
+    """
+    Cached availability calendar for one product (or one of its variants).
+
+    Loads the product's active bookings in the horizon in one query and
+    builds the whole timeline in a single pass. Entries are keyed on the
+    product's availability version, so any booking change invalidates them.
+    """
+    step = CALENDAR_STEPS[resolution]
+    end_date = start_date + timedelta(days=days)
+
+    # Stock level is part of the key, so product edits need no explicit bump
+    quantity_on_hand = get_stock_quantity(product, variant)
+    version = get_availability_version(product.pk)
+    cache_key = (
+        f'availability_calendar:{product.pk}:{variant.pk if variant else ""}:{version}:'
+        f'{quantity_on_hand}:{resolution}:{days}:{start_date.isoformat()}'
+    )
+    slots = cache.get(cache_key)
+    if slots is None:
+        intervals = overlapping_intervals(product, start_date, end_date, variant=variant)
+        slots = build_availability_timeline(
+            quantity_on_hand, intervals, start_date, end_date, step
+        )
+        cache.set(cache_key, slots, CALENDAR_CACHE_TIMEOUT)
+    return slots
@@ -1,22 +1,57 @@
-from .models import Quotation
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils.functional import SimpleLazyObject
+
+from .models import Quotation, QuotationLine
+
+
+# Counts are dropped on every cart change, but only in the cache of the worker
+# that made it unless the backend is shared, so stale entries must expire soon
+CART_COUNT_CACHE_TIMEOUT = 5 * 60
+
+
+def cart_count_cache_key(user_id):
+    return f'cart_count:{user_id}'
+
+
+def invalidate_cart_count(user_id):
+    """Forget the cached badge count after the user's cart changed"""
+    cache.delete(cart_count_cache_key(user_id))
+
+
+def get_cart_count(user):
+    """Units in the user's draft cart, from the cache when possible"""
+    key = cart_count_cache_key(user.pk)
+    cart_count = cache.get(key)
+    if cart_count is None:
+        cart_count = QuotationLine.objects.filter(
+            quotation__customer=user,
+            quotation__status='draft'
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        cache.set(key, cart_count, CART_COUNT_CACHE_TIMEOUT)
+    return cart_count
 
 
 def cart_processor(request):
-    """Add cart/quotation info to all templates"""
-    cart_count = 0
-    cart = None
-    
-    if request.user.is_authenticated and hasattr(request.user, 'is_customer') and request.user.is_customer():
-        # Get or create draft quotation
-        cart = Quotation.objects.filter(
-            customer=request.user,
-            status='draft'
-        ).first()
-        
-        if cart:
-            cart_count = sum(line.quantity for line in cart.lines.all())
-    
+    """
+    Add cart/quotation info to all templates.
+
+    Both values are lazy: pages that never use them run no queries, and the
+    badge count is served from the cache until the cart changes.
+    """
+    def is_customer():
+        user = request.user
+        return user.is_authenticated and hasattr(user, 'is_customer') and user.is_customer()
+
+    def cart():
+        if not is_customer():
+            return None
+        return Quotation.objects.filter(customer=request.user, status='draft').first()
+
+    def cart_count():
+        return get_cart_count(request.user) if is_customer() else 0
+
     return {
-        'cart': cart,
-        'cart_count': cart_count,
+        'cart': SimpleLazyObject(cart),
+        'cart_count': SimpleLazyObject(cart_count),
     }
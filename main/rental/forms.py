@@ -62,11 +62,15 @@ class AddToCartForm(forms.Form):
         
         if product:
             # Set variant choices
+            variants = list(product.variants.all())
             self.fields['variant'].queryset = product.variants.all()
             
-            # Set max quantity based on available stock
-            if product.quantity_on_hand > 0:
-                self.fields['quantity'].widget.attrs['max'] = product.quantity_on_hand
+            # Set max quantity based on available stock - the largest of the
+            # product's own stock and its variants' stock, since the variant
+            # is picked in the same form
+            max_stock = max([product.quantity_on_hand] + [v.quantity_on_hand for v in variants])
+            if max_stock > 0:
+                self.fields['quantity'].widget.attrs['max'] = max_stock
         
         # Add Bootstrap classes
         for field in self.fields.values():
@@ -77,6 +81,7 @@ class AddToCartForm(forms.Form):
         start_date = cleaned_data.get('start_date')
         end_date = cleaned_data.get('end_date')
         quantity = cleaned_data.get('quantity')
+        variant = cleaned_data.get('variant')
         
         if start_date and end_date:
             if start_date >= end_date:
@@ -84,7 +89,7 @@ class AddToCartForm(forms.Form):
             
             # Check availability
             if self.product:
-                available = self.product.get_available_quantity(start_date, end_date)
+                available = self.product.get_available_quantity(start_date, end_date, variant=variant)
                 if quantity and quantity > available:
                     raise ValidationError(f"Only {available} units available for selected dates")
         
@@ -0,0 +1,60 @@
+"""
+Database-backed job queue.
+
+Slow side work (emails, PDFs) is queued as a Job row instead of being done
+inside the request. `manage.py run_jobs` processes the queue. Each worker
+claims one due job at a time with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of workers can run side by side without picking the same job. The
+job runs inside that transaction: if the worker dies, the lock is released
+and the job is simply picked up again. A job that raises is retried with
+exponential backoff until max_attempts, then left as failed.
+"""
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+def enqueue(task, **kwargs):
+    """Queue `task` (dotted path of a function) to be called with JSON-serialisable kwargs"""
+    return Job.objects.create(task=task, kwargs=kwargs)
+
+
+def retry_delay(attempts):
+    """Backoff before the next try: 30s, 1m, 2m, ... capped at an hour"""
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def run_next_job():
+    """Claim and run one due job; returns it, or None if nothing is due"""
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status='queued', run_at__lte=timezone.now()
+        ).order_by('run_at', 'pk').first()
+        if job is None:
+            return None
+
+        job.attempts += 1
+        try:
+            # Savepoint, so a failing task's own writes are undone but the retry is recorded
+            with transaction.atomic():
+                import_string(job.task)(**job.kwargs)
+        except Exception:
+            job.last_error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+            else:
+                job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = 'done'
+            job.last_error = ''
+        job.save()
+    return job
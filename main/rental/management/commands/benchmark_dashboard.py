@@ -0,0 +1,196 @@
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from rental.models import Invoice, OrderLine, Product, RentalOrder, rental_period
+from rental.stats import dashboard_figures, reports_overview
+
+
+def dashboard_figures_per_query(vendor, now):
+    """
+    The dashboard's headline numbers as they were computed before: one query
+    per figure, vendor orders found through their lines' products and return
+    urgency through the lines' end dates
+    """
+    if vendor is not None:
+        products = Product.objects.filter(vendor=vendor)
+        orders = RentalOrder.objects.filter(lines__product__vendor=vendor).distinct()
+    else:
+        products = Product.objects.all()
+        orders = RentalOrder.objects.all()
+    invoices = Invoice.objects.filter(order__in=orders)
+
+    within_24h = now + timedelta(hours=24)
+    urgent_returns = orders.filter(
+        status__in=['picked_up', 'rented']
+    ).filter(
+        Q(lines__end_date__lt=now) |
+        Q(lines__end_date__lte=within_24h, lines__end_date__gte=now)
+    ).distinct()
+    return {
+        'total_products': products.count(),
+        'total_orders': orders.count(),
+        'active_rentals': orders.filter(status='rented').count(),
+        'total_revenue': invoices.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00'),
+        'pending_revenue': invoices.filter(status__in=['draft', 'sent']).aggregate(
+            total=Sum('total_amount')
+        )['total'] or Decimal('0.00'),
+        'urgent_returns_count': urgent_returns.count(),
+        'overdue_count': urgent_returns.filter(lines__end_date__lt=now).distinct().count(),
+        'approaching_count': urgent_returns.filter(
+            lines__end_date__lte=within_24h,
+            lines__end_date__gte=now
+        ).distinct().count(),
+    }
+
+
+def reports_overview_per_query(vendor):
+    """The reports dashboard's overview as it was computed before: one query per figure"""
+    if vendor is not None:
+        orders = RentalOrder.objects.filter(lines__product__vendor=vendor).distinct()
+        products = Product.objects.filter(vendor=vendor, is_rentable=True)
+    else:
+        orders = RentalOrder.objects.all()
+        products = Product.objects.filter(is_rentable=True)
+    return {
+        'total_orders': orders.count(),
+        'total_revenue': orders.aggregate(total=Sum('invoice__total_amount'))['total'] or Decimal('0.00'),
+        'active_customers': orders.values('customer').distinct().count(),
+        'active_products': products.count(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare query count and latency of the dashboard headline numbers, one query per '
+        'figure versus conditional aggregates, on seeded orders (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000, help='Orders to seed')
+        parser.add_argument('--vendors', type=int, default=10, help='Vendors to spread the orders over')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per case')
+        parser.add_argument('--keep', action='store_true', help='Commit the seeded data instead of rolling back')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            vendors = self.seed(options['orders'], options['vendors'])
+            self.stdout.write(
+                f"Seeded {options['orders']} orders for {len(vendors)} vendors "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+
+            now = timezone.now()
+            cases = [
+                ('dashboard, one vendor', lambda: dashboard_figures_per_query(vendors[0], now),
+                 lambda: dashboard_figures(vendors[0], now)),
+                ('dashboard, all vendors', lambda: dashboard_figures_per_query(None, now),
+                 lambda: dashboard_figures(None, now)),
+                ('reports, one vendor', lambda: reports_overview_per_query(vendors[0]),
+                 lambda: reports_overview(vendors[0])),
+                ('reports, all vendors', lambda: reports_overview_per_query(None),
+                 lambda: reports_overview(None)),
+            ]
+            self.stdout.write(f"{'':24} {'before':>20} {'after':>20}")
+            for label, before, after in cases:
+                # Both ways must agree before their speed means anything
+                if before() != after():
+                    self.stderr.write(self.style.ERROR(f'{label}: figures differ: {before()} != {after()}'))
+                self.stdout.write(
+                    f'{label:24} {self.measure(before, options["repeat"]):>20} '
+                    f'{self.measure(after, options["repeat"]):>20}'
+                )
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def measure(self, func, repeat):
+        """'<queries> q, <median> ms' for calling func `repeat` times"""
+        func()  # Warm up caches and the connection
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+        return f'{len(queries)} q, {statistics.median(timings):.1f} ms'
+
+    def seed(self, order_count, vendor_count):
+        """Vendors with products, customers, and orders with a line and an invoice spread over them"""
+        random.seed(0)
+        tag = f'bench{int(time.time())}'
+        vendors = User.objects.bulk_create([
+            User(username=f'{tag}-vendor{n}', role='vendor') for n in range(vendor_count)
+        ])
+        customers = User.objects.bulk_create([
+            User(username=f'{tag}-customer{n}', role='customer') for n in range(max(order_count // 20, 1))
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                vendor=vendor, name=f'Product {n}',
+                price_per_day=100, quantity_on_hand=10, is_rentable=n % 5 != 0,
+            )
+            for vendor in vendors for n in range(50)
+        ])
+        vendor_products = defaultdict(list)
+        for product in products:
+            vendor_products[product.vendor_id].append(product)
+
+        now = timezone.now()
+        statuses = [status for status, _ in RentalOrder.STATUS_CHOICES]
+        invoice_statuses = [status for status, _ in Invoice.STATUS_CHOICES]
+        batch_size = 5000
+        for start in range(0, order_count, batch_size):
+            orders = RentalOrder.objects.bulk_create([
+                RentalOrder(
+                    customer=random.choice(customers),
+                    vendor=random.choice(vendors),
+                    order_number=f'{tag}-{n}',
+                    status=random.choice(statuses),
+                    return_due_at=now + timedelta(hours=random.randint(-72, 240)),
+                )
+                for n in range(start, min(start + batch_size, order_count))
+            ])
+            # One line per order, ending when the order is due back, so the old
+            # line-based queries and the new order-based ones see the same orders
+            lines = []
+            for order in orders:
+                start_date = order.return_due_at - timedelta(days=random.randint(1, 14))
+                lines.append(OrderLine(
+                    order=order,
+                    product=random.choice(vendor_products[order.vendor_id]),
+                    quantity=1,
+                    start_date=start_date,
+                    end_date=order.return_due_at,
+                    period=rental_period(start_date, order.return_due_at),
+                    unit_price=100,
+                ))
+            OrderLine.objects.bulk_create(lines)
+
+            invoices = []
+            for order in orders:
+                total = Decimal(random.randint(500, 50000))
+                invoices.append(Invoice(
+                    order=order,
+                    invoice_number=f'{order.order_number}-inv',
+                    status=random.choice(invoice_statuses),
+                    subtotal=total, tax_amount=0, total_amount=total,
+                    amount_paid=total if random.random() < 0.6 else 0,
+                ))
+            Invoice.objects.bulk_create(invoices)
+
+        # Fresh planner statistics, or the new rows are planned as if the tables were empty
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE rental_rentalorder, rental_orderline, rental_invoice, rental_product')
+        return vendors
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rental.stats import recompute_vendor_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-vendor dashboard counters from scratch (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        changed = recompute_vendor_stats()
+        self.stdout.write(self.style.SUCCESS(f'Corrected stats for {changed} vendor(s)'))
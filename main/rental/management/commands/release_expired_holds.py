@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rental.availability import bump_availability_version
+from rental.models import QuotationLine
+
+
+class Command(BaseCommand):
+    help = 'Release cart holds whose time limit has passed (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        expired = QuotationLine.objects.filter(hold_expires_at__lte=timezone.now())
+
+        # Collect affected products first so their cached availability can be dropped
+        product_ids = set(expired.values_list('product_id', flat=True))
+        released = expired.update(hold_expires_at=None)
+
+        if product_ids:
+            bump_availability_version(*product_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired cart hold(s)'))
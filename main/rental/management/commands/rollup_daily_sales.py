@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from rental.rollups import rebuild_all_sales_days, rollup_changed_days
+
+
+class Command(BaseCommand):
+    help = 'Roll up the days whose orders changed into the daily sales table (run often, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every day, not just changed ones')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            count = rebuild_all_sales_days()
+        else:
+            count = len(rollup_changed_days())
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {count} day(s) of sales'))
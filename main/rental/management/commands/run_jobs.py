@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental.jobs import run_next_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs (emails, PDFs); run one or more of these alongside the web server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due instead of waiting')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            job = run_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            processed += 1
+            style = self.style.SUCCESS if job.status == 'done' else self.style.WARNING
+            self.stdout.write(style(f'Job {job.pk} {job.task}: {job.status} (attempt {job.attempts})'))
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
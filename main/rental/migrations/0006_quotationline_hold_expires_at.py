@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0005_productimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotationline',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='quotationline',
+            index=models.Index(condition=models.Q(('hold_expires_at__isnull', False)), fields=['product', 'hold_expires_at'], name='quotationline_hold_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0006_quotationline_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(fields=['variant', 'start_date', 'end_date'], name='orderline_variant_period_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:44
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.db import migrations, models
+from django.db.models import F, Func, Max, Value
+
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_periods(apps, schema_editor):
+    """Fill period from start/end dates in primary-key batches, one commit per batch"""
+    for model_name in ['OrderLine', 'QuotationLine']:
+        model = apps.get_model('rental', model_name)
+        max_id = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        for batch_start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            model.objects.filter(
+                id__gte=batch_start,
+                id__lt=batch_start + BACKFILL_BATCH_SIZE,
+                period__isnull=True,
+            ).update(period=Func(
+                F('start_date'), F('end_date'), Value('[)'),
+                function='tstzrange', output_field=DateTimeRangeField()
+            ))
+
+
+class Migration(migrations.Migration):
+
+    # Let each backfill batch commit on its own instead of one long transaction
+    atomic = False
+
+    dependencies = [
+        ('rental', '0007_orderline_variant_period_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderline',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='quotationline',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_periods, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['period'], name='orderline_period_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='quotationline',
+            index=django.contrib.postgres.indexes.GistIndex(condition=models.Q(('hold_expires_at__isnull', False)), fields=['period'], name='quotationline_hold_period_gist'),
+        ),
+    ]
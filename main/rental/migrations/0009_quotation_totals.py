@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_totals(apps, schema_editor):
+    """Fill the stored totals of existing quotations in one UPDATE"""
+    Quotation = apps.get_model('rental', 'Quotation')
+    QuotationLine = apps.get_model('rental', 'QuotationLine')
+    lines = QuotationLine.objects.filter(quotation=OuterRef('pk')).order_by().values('quotation')
+    subtotal = Coalesce(
+        Subquery(lines.annotate(total=Sum(F('unit_price') * F('quantity'))).values('total')),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+    Quotation.objects.update(
+        subtotal=subtotal,
+        tax_amount=Round(subtotal * Decimal('0.18'), 2),
+        line_count=Coalesce(Subquery(lines.annotate(n=Count('id')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0008_rental_period_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotation',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quotation',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='quotation',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
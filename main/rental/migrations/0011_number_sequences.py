@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+# Numbers a process reserves per sequence round trip (see rental/numbering.py)
+NUMBER_BLOCK_SIZE = 50
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0010_job'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f'CREATE SEQUENCE rental_order_number_seq START 10000 INCREMENT {NUMBER_BLOCK_SIZE}',
+                f'CREATE SEQUENCE rental_invoice_number_seq START 10000 INCREMENT {NUMBER_BLOCK_SIZE}',
+            ],
+            reverse_sql=[
+                'DROP SEQUENCE rental_order_number_seq',
+                'DROP SEQUENCE rental_invoice_number_seq',
+            ],
+        ),
+    ]
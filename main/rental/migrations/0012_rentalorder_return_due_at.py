@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def backfill_return_due_at(apps, schema_editor):
+    """Set return_due_at of existing orders to their latest line end date"""
+    RentalOrder = apps.get_model('rental', 'RentalOrder')
+    OrderLine = apps.get_model('rental', 'OrderLine')
+    latest_end = OrderLine.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(
+        latest=Max('end_date')
+    ).values('latest')
+    RentalOrder.objects.update(return_due_at=Subquery(latest_end))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0011_number_sequences'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rentalorder',
+            name='return_due_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_return_due_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rentalorder',
+            index=models.Index(condition=models.Q(('status__in', ['picked_up', 'rented'])), fields=['return_due_at'], name='rentalorder_return_due_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0012_rentalorder_return_due_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', 'created_at', 'id'], name='product_vendor_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalorder',
+            index=models.Index(fields=['created_at', 'id'], name='rentalorder_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalorder',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='rentalorder_cust_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_vendor(apps, schema_editor):
+    """Set the vendor of existing orders from the product of their first line"""
+    RentalOrder = apps.get_model('rental', 'RentalOrder')
+    OrderLine = apps.get_model('rental', 'OrderLine')
+    first_vendor = OrderLine.objects.filter(order=OuterRef('pk')).order_by('pk').values('product__vendor')[:1]
+    RentalOrder.objects.update(vendor=Subquery(first_vendor))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0013_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rentalorder',
+            name='vendor',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vendor_orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_vendor, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rentalorder',
+            index=models.Index(fields=['vendor', 'created_at', 'id'], name='rentalorder_vendor_keyset_idx'),
+        ),
+    ]
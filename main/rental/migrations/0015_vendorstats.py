@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_vendor_stats(apps, schema_editor):
+    """Count the existing products, orders and invoices of every vendor"""
+    VendorStats = apps.get_model('rental', 'VendorStats')
+    Product = apps.get_model('rental', 'Product')
+    RentalOrder = apps.get_model('rental', 'RentalOrder')
+    Invoice = apps.get_model('rental', 'Invoice')
+    stats = {}
+    for row in Product.objects.order_by().values('vendor').annotate(total=Count('pk')):
+        stats.setdefault(row['vendor'], VendorStats(vendor_id=row['vendor'])).total_products = row['total']
+    for row in RentalOrder.objects.filter(vendor__isnull=False).order_by().values('vendor').annotate(
+        total=Count('pk'), active=Count('pk', filter=Q(status='rented'))
+    ):
+        row_stats = stats.setdefault(row['vendor'], VendorStats(vendor_id=row['vendor']))
+        row_stats.total_orders, row_stats.active_rentals = row['total'], row['active']
+    for row in Invoice.objects.filter(order__vendor__isnull=False).order_by().values('order__vendor').annotate(
+        paid=Sum('amount_paid'), pending=Sum('total_amount', filter=Q(status__in=['draft', 'sent']))
+    ):
+        row_stats = stats.setdefault(row['order__vendor'], VendorStats(vendor_id=row['order__vendor']))
+        row_stats.total_revenue, row_stats.pending_revenue = row['paid'] or 0, row['pending'] or 0
+    VendorStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0014_rentalorder_vendor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_products', models.IntegerField(default=0)),
+                ('total_orders', models.IntegerField(default=0)),
+                ('active_rentals', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('vendor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Vendor Stats',
+            },
+        ),
+        migrations.RunPython(backfill_vendor_stats, migrations.RunPython.noop),
+    ]
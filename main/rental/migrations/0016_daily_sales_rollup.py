@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def mark_existing_days(apps, schema_editor):
+    """Queue every day that has orders, so the first rollup run fills the table"""
+    RentalOrder = apps.get_model('rental', 'RentalOrder')
+    ChangedSalesDay = apps.get_model('rental', 'ChangedSalesDay')
+    days = RentalOrder.objects.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+    ChangedSalesDay.objects.bulk_create([ChangedSalesDay(date=day) for day in days])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0015_vendorstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangedSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('picked_up', 'Picked Up'), ('rented', 'Rented'), ('returned', 'Returned'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='dailysalesrollup_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vendor', 'date', 'status'), name='dailysalesrollup_unique_day', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(mark_existing_days, migrations.RunPython.noop),
+    ]
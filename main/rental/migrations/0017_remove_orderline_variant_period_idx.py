@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0016_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderline',
+            name='orderline_variant_period_idx',
+        ),
+    ]
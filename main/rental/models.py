@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
 from django.conf import settings
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.text import slugify
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 import json
 
 
@@ -85,44 +88,27 @@ class Product(models.Model):
     def __str__(self):
         return self.name
     
-    def get_available_quantity(self, start_date=None, end_date=None):
-        """Calculate available quantity for given date range"""
+    def get_available_quantity(self, start_date=None, end_date=None, variant=None):
+        """Calculate available quantity for given date range (of a variant's stock if given)"""
         if not start_date or not end_date:
-            return self.quantity_on_hand
+            return variant.quantity_on_hand if variant else self.quantity_on_hand
         
-        # Check overlapping rentals
-        overlapping = OrderLine.objects.filter(
-            product=self,
-            order__status__in=['confirmed', 'picked_up', 'rented'],
-            start_date__lt=end_date,
-            end_date__gt=start_date
-        )
-        
-        reserved_qty = sum(line.quantity for line in overlapping)
-        return max(0, self.quantity_on_hand - reserved_qty)
+        # Peak concurrent reservations, not the sum of every overlapping line
+        from .availability import get_available_quantity
+        return get_available_quantity(self, start_date, end_date, variant=variant)
     
-    def calculate_rental_price(self, start_date, end_date):
-        """Calculate rental price based on duration"""
-        if not start_date or not end_date:
-            return Decimal('0.00')
-        
-        duration = end_date - start_date
-        hours = duration.total_seconds() / 3600
-        days = duration.days
-        weeks = days // 7
-        
-        # Choose best pricing strategy
-        if weeks > 0 and self.price_per_week > 0:
-            return self.price_per_week * weeks
-        elif days > 0 and self.price_per_day > 0:
-            return self.price_per_day * days
-        elif hours > 0 and self.price_per_hour > 0:
-            return self.price_per_hour * Decimal(str(hours))
-        else:
-            return self.sales_price
+    def calculate_rental_price(self, start_date, end_date, variant=None):
+        """Calculate rental price based on duration (cheapest weeks/days/hours mix)"""
+        from .pricing import quote_rental_prices
+        return quote_rental_prices([(self, start_date, end_date, variant)])[0]
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination walks (created_at, id), see pagination.py
+            models.Index(fields=['created_at', 'id'], name='product_keyset_idx'),
+            models.Index(fields=['vendor', 'created_at', 'id'], name='product_vendor_keyset_idx'),
+        ]
 
 
 class ProductImage(models.Model):
@@ -169,6 +155,25 @@ class ProductVariant(models.Model):
         return self.price_per_week or self.product.price_per_week
 
 
+def rental_period(start_date, end_date):
+    """Half-open [start, end) range matching how bookings overlap"""
+    if not start_date or not end_date:
+        return None
+    return DateTimeTZRange(start_date, end_date, '[)')
+
+
+def generate_order_number():
+    """New RO<date><n> order number (also used where save() is bypassed)"""
+    from .numbering import order_numbers
+    return f"RO{timezone.now().strftime('%Y%m%d')}{order_numbers.allocate()}"
+
+
+def generate_invoice_number():
+    """New INV<date><n> invoice number (also used where save() is bypassed)"""
+    from .numbering import invoice_numbers
+    return f"INV{timezone.now().strftime('%Y%m%d')}{invoice_numbers.allocate()}"
+
+
 class Quotation(models.Model):
     """Cart/Quotation before confirmation"""
     STATUS_CHOICES = [
@@ -182,15 +187,56 @@ class Quotation(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     notes = models.TextField(blank=True)
     
+    # Running totals of the lines, kept up to date by update_totals()
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    line_count = models.PositiveIntegerField(default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Quotation {self.id} - {self.customer.username}"
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # The totals are written by update_totals() only, so a copy loaded
+            # before a line changed cannot put old totals back
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('subtotal', 'tax_amount', 'line_count')
+            ]
+        super().save(*args, **kwargs)
+    
     def get_total(self):
         return sum(line.get_total() for line in self.lines.all())
     
+    def update_totals(self):
+        """Recompute the stored subtotal, tax and line count from the lines"""
+        with transaction.atomic():
+            # Lock the quotation so concurrent line changes are summed one after another
+            customer_id = Quotation.objects.select_for_update().filter(pk=self.pk).values_list(
+                'customer_id', flat=True
+            ).first()
+            if customer_id is None:
+                return
+            self.customer_id = customer_id
+            totals = self.lines.aggregate(
+                subtotal=models.Sum(models.F('unit_price') * models.F('quantity')),
+                line_count=models.Count('id'),
+            )
+            self.subtotal = totals['subtotal'] or Decimal('0.00')
+            # Half up, like the migration 0009 backfill (SQL ROUND) and checkout's invoices
+            self.tax_amount = (self.subtotal * Decimal('18.00') / 100).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+            self.line_count = totals['line_count']
+            Quotation.objects.filter(pk=self.pk).update(
+                subtotal=self.subtotal,
+                tax_amount=self.tax_amount,
+                line_count=self.line_count,
+            )
+    
     def get_tax_amount(self, tax_rate=18):
         """Calculate GST"""
         subtotal = self.get_total()
@@ -210,9 +256,19 @@ class QuotationLine(models.Model):
     end_date = models.DateTimeField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    # Soft reservation while the line sits in a draft cart (see CART_HOLD_MINUTES)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    # [start_date, end_date) as a tstzrange, kept in sync on save for GiST overlap queries
+    period = DateTimeRangeField(null=True, blank=True, editable=False)
+    
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
     
+    def save(self, *args, **kwargs):
+        self.period = rental_period(self.start_date, self.end_date)
+        super().save(*args, **kwargs)
+    
     def get_total(self):
         return self.unit_price * self.quantity
     
@@ -221,9 +277,29 @@ class QuotationLine(models.Model):
         if self.start_date >= self.end_date:
             raise ValidationError("End date must be after start date")
         
-        available = self.product.get_available_quantity(self.start_date, self.end_date)
+        # Don't count this line's own hold against itself
+        from .availability import get_available_quantity
+        available = get_available_quantity(
+            self.product, self.start_date, self.end_date,
+            exclude_hold_id=self.id, variant=self.variant
+        )
         if self.quantity > available:
             raise ValidationError(f"Only {available} units available for selected dates")
+    
+    class Meta:
+        indexes = [
+            # Only lines with a hold are indexed, so availability checks never scan carts
+            models.Index(
+                fields=['product', 'hold_expires_at'],
+                name='quotationline_hold_idx',
+                condition=models.Q(hold_expires_at__isnull=False),
+            ),
+            GistIndex(
+                fields=['period'],
+                name='quotationline_hold_period_gist',
+                condition=models.Q(hold_expires_at__isnull=False),
+            ),
+        ]
 
 
 class RentalOrder(models.Model):
@@ -244,6 +320,11 @@ class RentalOrder(models.Model):
     
     quotation = models.OneToOneField(Quotation, on_delete=models.SET_NULL, null=True, blank=True)
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
+    # Checkout places one order per vendor; indexed by rentalorder_vendor_keyset_idx
+    vendor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='vendor_orders',
+        null=True, blank=True, db_index=False
+    )
     order_number = models.CharField(max_length=50, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
@@ -260,14 +341,22 @@ class RentalOrder(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
     
+    # Latest end date of the lines, kept in sync by update_return_due_at()
+    return_due_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
     def __str__(self):
         return f"Order {self.order_number}"
     
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number
-            import random
-            self.order_number = f"RO{timezone.now().strftime('%Y%m%d')}{random.randint(1000, 9999)}"
+            self.order_number = generate_order_number()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # return_due_at is written by update_return_due_at() only, so a copy
+            # loaded before a line changed cannot put the old value back
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'return_due_at'
+            ]
         super().save(*args, **kwargs)
     
     def get_total(self):
@@ -282,7 +371,14 @@ class RentalOrder(models.Model):
     
     def get_latest_return_date(self):
         """Get the latest return date from all order lines"""
-        return max((line.end_date for line in self.lines.all()), default=None)
+        return self.return_due_at
+    
+    def update_return_due_at(self):
+        """Recompute the stored return_due_at from the lines in one UPDATE"""
+        latest_end = OrderLine.objects.filter(order=models.OuterRef('pk')).order_by().values('order').annotate(
+            latest=models.Max('end_date')
+        ).values('latest')
+        RentalOrder.objects.filter(pk=self.pk).update(return_due_at=models.Subquery(latest_end))
     
     def has_approaching_return(self):
         """Check if return date is within 1 day"""
@@ -319,6 +415,20 @@ class RentalOrder(models.Model):
         if self.has_approaching_return():
             return 'approaching'
         return 'normal'
+    
+    class Meta:
+        indexes = [
+            # Urgent/overdue/approaching lookups only ever look at orders out on rent
+            models.Index(
+                fields=['return_due_at'],
+                name='rentalorder_return_due_idx',
+                condition=models.Q(status__in=['picked_up', 'rented']),
+            ),
+            # Keyset pagination walks (created_at, id), see pagination.py
+            models.Index(fields=['created_at', 'id'], name='rentalorder_keyset_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='rentalorder_cust_keyset_idx'),
+            models.Index(fields=['vendor', 'created_at', 'id'], name='rentalorder_vendor_keyset_idx'),
+        ]
 
 
 class OrderLine(models.Model):
@@ -331,9 +441,16 @@ class OrderLine(models.Model):
     end_date = models.DateTimeField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    # [start_date, end_date) as a tstzrange, kept in sync on save for GiST overlap queries
+    period = DateTimeRangeField(null=True, blank=True, editable=False)
+    
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
     
+    def save(self, *args, **kwargs):
+        self.period = rental_period(self.start_date, self.end_date)
+        super().save(*args, **kwargs)
+    
     def get_total(self):
         return self.unit_price * self.quantity
     
@@ -343,18 +460,21 @@ class OrderLine(models.Model):
             raise ValidationError("End date must be after start date")
         
         # Check for overlapping reservations (excluding self if updating)
-        overlapping = OrderLine.objects.filter(
-            product=self.product,
-            order__status__in=['confirmed', 'picked_up', 'rented'],
-            start_date__lt=self.end_date,
-            end_date__gt=self.start_date
-        ).exclude(id=self.id if self.id else None)
-        
-        reserved_qty = sum(line.quantity for line in overlapping)
-        available = self.product.quantity_on_hand - reserved_qty
+        from .availability import get_reserved_quantity, get_stock_quantity
+        reserved_qty = get_reserved_quantity(
+            self.product, self.start_date, self.end_date,
+            exclude_line_id=self.id, variant=self.variant
+        )
+        available = get_stock_quantity(self.product, self.variant) - reserved_qty
         
         if self.quantity > available:
             raise ValidationError(f"Only {available} units available for selected dates. {reserved_qty} already reserved.")
+    
+    class Meta:
+        indexes = [
+            # Overlap lookups (also per variant) filter on period && and use this
+            GistIndex(fields=['period'], name='orderline_period_gist'),
+        ]
 
 
 class Pickup(models.Model):
@@ -441,8 +561,7 @@ class Invoice(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            import random
-            self.invoice_number = f"INV{timezone.now().strftime('%Y%m%d')}{random.randint(1000, 9999)}"
+            self.invoice_number = generate_invoice_number()
         
         # Calculate totals
         if self.order:
@@ -536,8 +655,90 @@ class SystemSettings(models.Model):
         verbose_name_plural = "System Settings"
 
 
+class Job(models.Model):
+    """Background task stored in the database and run by `manage.py run_jobs` (see rental/jobs.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=200, help_text='Dotted path of the function to call')
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            # Workers only ever look for due queued jobs
+            models.Index(
+                fields=['run_at'],
+                name='job_queued_run_at_idx',
+                condition=models.Q(status='queued'),
+            ),
+        ]
+
+
+class VendorStats(models.Model):
+    """Dashboard counters for one vendor, kept up to date by rental/stats.py"""
+    vendor = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stats')
+    total_products = models.IntegerField(default=0)
+    total_orders = models.IntegerField(default=0)
+    active_rentals = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Stats for {self.vendor}"
+    
+    class Meta:
+        verbose_name_plural = "Vendor Stats"
+
+
+class DailySalesRollup(models.Model):
+    """Orders placed on one day for one vendor and status, filled by rental/rollups.py"""
+    vendor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_sales', null=True, blank=True
+    )
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=RentalOrder.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    # Orders that have an invoice, for the average order value
+    invoice_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.order_count} order(s)"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['vendor', 'date', 'status'], name='dailysalesrollup_unique_day', nulls_distinct=False
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='dailysalesrollup_date_idx'),
+        ]
+
+
+class ChangedSalesDay(models.Model):
+    """A day whose orders changed since the last rollup; one row per change, removed once rolled up"""
+    date = models.DateField()
+
+
 # Signal handlers for inventory management
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete, post_init
 from django.dispatch import receiver
 
 @receiver(pre_save, sender=RentalOrder)
@@ -546,18 +747,147 @@ def restore_quantity_on_cancel(sender, instance, **kwargs):
     if instance.pk:  # Only for existing orders
         try:
             old_order = RentalOrder.objects.get(pk=instance.pk)
+            # Any status change can add or release reservations
+            if old_order.status != instance.status:
+                from .availability import bump_availability_version
+                bump_availability_version(*instance.lines.values_list('product_id', flat=True))
             # If order status changed to cancelled or returned
             if old_order.status not in ['cancelled', 'returned'] and instance.status in ['cancelled', 'returned']:
-                # Restore quantities for all order lines
-                for line in instance.lines.all():
-                    line.product.quantity_on_hand += line.quantity
-                    line.product.save()
+                # Restore quantities for all order lines (to the variant's stock if any)
+                for line in instance.lines.select_related('product', 'variant'):
+                    stock = line.variant or line.product
+                    stock.quantity_on_hand += line.quantity
+                    stock.save()
         except RentalOrder.DoesNotExist:
             pass
 
+@receiver(post_save, sender=QuotationLine)
+@receiver(post_delete, sender=QuotationLine)
+def invalidate_availability_on_hold_change(sender, instance, **kwargs):
+    """Cart holds count against availability, so drop cached answers when one changes"""
+    if instance.hold_expires_at:
+        from .availability import bump_availability_version
+        bump_availability_version(instance.product_id)
+
+@receiver(post_save, sender=QuotationLine)
+@receiver(post_delete, sender=QuotationLine)
+def update_quotation_totals(sender, instance, **kwargs):
+    """Keep the cart's stored totals and badge count in step with its lines"""
+    from .context_processors import invalidate_cart_count
+    quotation = Quotation(pk=instance.quotation_id)
+    quotation.update_totals()
+    if quotation.customer_id:
+        invalidate_cart_count(quotation.customer_id)
+
+@receiver(post_save, sender=Quotation)
+@receiver(post_delete, sender=Quotation)
+def invalidate_cart_count_on_quotation_change(sender, instance, **kwargs):
+    """A cart that is checked out or deleted no longer counts towards the badge"""
+    from .context_processors import invalidate_cart_count
+    invalidate_cart_count(instance.customer_id)
+
+@receiver(post_init, sender=OrderLine)
+def remember_line_product(sender, instance, **kwargs):
+    """Note the product a loaded line books, so moving it frees the old product's availability"""
+    if instance.pk is not None:
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+
+@receiver(post_save, sender=OrderLine)
+def invalidate_availability_on_line_save(sender, instance, **kwargs):
+    """Drop cached availability for the product of a new or edited order line (and its old product)"""
+    from .availability import bump_availability_version
+    product_ids = {instance.product_id, getattr(instance, '_loaded_product_id', None)} - {None}
+    bump_availability_version(*product_ids)
+    instance._loaded_product_id = instance.product_id
+
+@receiver(post_save, sender=OrderLine)
+def set_order_vendor(sender, instance, created, **kwargs):
+    """Orders put together outside checkout take the vendor of their first line"""
+    if created:
+        order = RentalOrder.objects.filter(pk=instance.order_id, vendor__isnull=True).first()
+        if order:
+            # Saved rather than updated so the vendor's stats count the order
+            order.vendor_id = instance.product.vendor_id
+            order.save(update_fields=['vendor'])
+
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def update_order_return_due_at(sender, instance, **kwargs):
+    """Keep the order's return_due_at equal to its latest line end date"""
+    RentalOrder(pk=instance.order_id).update_return_due_at()
+
 @receiver(post_delete, sender=OrderLine)
 def restore_quantity_on_delete(sender, instance, **kwargs):
     """Restore product quantity when order line is deleted"""
+    from .availability import bump_availability_version
+    bump_availability_version(instance.product_id)
     if instance.order.status not in ['cancelled', 'returned']:
-        instance.product.quantity_on_hand += instance.quantity
-        instance.product.save()
+        stock = instance.variant or instance.product
+        stock.quantity_on_hand += instance.quantity
+        stock.save()
+
+@receiver(post_save, sender=Product)
+def invalidate_tariffs_on_product_save(sender, instance, **kwargs):
+    """Drop this process's compiled tariffs (other processes key on updated_at)"""
+    from .pricing import invalidate_tariffs
+    invalidate_tariffs(instance.pk)
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_tariffs_on_variant_change(sender, instance, **kwargs):
+    """Variant prices override the product's, so treat a variant change as a product change"""
+    from .pricing import invalidate_tariffs
+    invalidate_tariffs(instance.product_id)
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=RentalOrder)
+@receiver(post_init, sender=Invoice)
+def remember_stats_figures(sender, instance, **kwargs):
+    """Note what a loaded row counts for, so saving it applies only the difference"""
+    from .stats import is_tracked, vendor_figures
+    if instance.pk is not None and is_tracked(instance):
+        instance._stats_figures = vendor_figures(instance)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=RentalOrder)
+@receiver(post_save, sender=Invoice)
+def update_vendor_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """Move the vendor's dashboard counters by what this save changed"""
+    from .stats import apply_stats_change, vendor_figures
+    if raw or not (created or hasattr(instance, '_stats_figures')):
+        return
+    figures = vendor_figures(instance)
+    apply_stats_change(sender, None if created else instance._stats_figures, figures)
+    instance._stats_figures = figures
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=RentalOrder)
+@receiver(post_delete, sender=Invoice)
+def update_vendor_stats_on_delete(sender, instance, **kwargs):
+    """Take a deleted row out of its vendor's dashboard counters"""
+    from .stats import apply_stats_change
+    if hasattr(instance, '_stats_figures'):
+        apply_stats_change(sender, instance._stats_figures, None)
+
+@receiver(post_save, sender=RentalOrder)
+@receiver(post_delete, sender=RentalOrder)
+def mark_sales_day_on_order_change(sender, instance, raw=False, **kwargs):
+    """Queue the order's day for the next daily sales rollup"""
+    from .rollups import mark_sales_days_changed
+    if not raw:
+        mark_sales_days_changed(instance.created_at)
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def mark_sales_day_on_invoice_change(sender, instance, raw=False, **kwargs):
+    """Invoice totals are the rollup's revenue, so queue the order's day too"""
+    from .rollups import mark_sales_days_changed
+    if not raw:
+        mark_sales_days_changed(instance.order.created_at)
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def mark_sales_days_on_vendor_delete(sender, instance, **kwargs):
+    """A deleted vendor's orders stay, without a vendor, so their days are rolled up again"""
+    from .rollups import mark_sales_days_changed
+    mark_sales_days_changed(*RentalOrder.objects.filter(vendor=instance).values_list('created_at', flat=True))
@@ -0,0 +1,53 @@
+"""
+Order and invoice numbers.
+
+Numbers look like RO<yyyymmdd><n> / INV<yyyymmdd><n>, built by
+generate_order_number / generate_invoice_number in models.py. The <n>
+part comes from a PostgreSQL sequence (see migration 0011), so it is
+unique across all workers whatever the date. The sequences step by a block size. One
+nextval() therefore hands a process a whole block of numbers, and it
+only goes back to the database when that block is used up. Sequences
+start at 10000, clear of the 4-digit random suffixes used before, and
+numbers are never reused. Blocks dropped at shutdown only leave gaps.
+"""
+import os
+import threading
+
+from django.db import connection
+
+
+class BlockAllocator:
+    """Hands out numbers from blocks reserved on a database sequence"""
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.lock = threading.Lock()
+        self.block_size = None
+        self.next_value = self.block_end = 0
+        self.pid = None
+
+    def reserve_block(self):
+        with connection.cursor() as cursor:
+            if self.block_size is None:
+                cursor.execute(
+                    'SELECT increment_by FROM pg_sequences WHERE sequencename = %s', [self.sequence]
+                )
+                self.block_size = cursor.fetchone()[0]
+            cursor.execute('SELECT nextval(%s)', [self.sequence])
+            self.next_value = cursor.fetchone()[0]
+        self.block_end = self.next_value + self.block_size
+
+    def allocate(self):
+        with self.lock:
+            # A forked worker must not reuse the block its parent was handing out
+            if self.pid != os.getpid() or self.next_value >= self.block_end:
+                self.reserve_block()
+                self.pid = os.getpid()
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+
+order_numbers = BlockAllocator('rental_order_number_seq')
+invoice_numbers = BlockAllocator('rental_invoice_number_seq')
+
@@ -0,0 +1,145 @@
+"""
+Keyset (cursor) pagination for newest-first lists.
+
+Instead of OFFSET, each page remembers the (created_at, id) of its last
+row, and the next page starts strictly after it. With an index on
+(..., created_at, id) the database can jump straight to the cursor, so
+page 1000 costs the same as page 1. Rows added while someone is paging
+do not shift the following pages either.
+
+Links carry ?after=<cursor> for the next page and ?before=<cursor> for
+the previous one. Cursors are opaque url-safe strings.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 25
+
+# Rows read per batch, as a multiple of the rows wanted, when a keep filter may reject some
+KEEP_BATCH_FACTOR = 2
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None, query=''):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # The request's other GET parameters (filters), for building page links
+        self.query = query
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def older_than(queryset, created_at, pk):
+    """Rows older than (created_at, pk); the created_at bound keeps this an index range scan"""
+    return queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(pk__lt=pk))
+
+
+def newer_than(queryset, created_at, pk):
+    """Rows newer than (created_at, pk)"""
+    return queryset.filter(created_at__gte=created_at).filter(Q(created_at__gt=created_at) | Q(pk__gt=pk))
+
+
+def take_rows(queryset, newest_first, limit, keep=None):
+    """
+    The first `limit` rows in keyset order, skipping rows `keep` rejects.
+
+    `keep` gets a batch of rows and returns the ones to show. Rows are read in
+    batches of KEEP_BATCH_FACTOR times `limit`, each batch starting after the
+    last row of the one before, until enough rows are kept or none are left.
+    """
+    ordering = ['-created_at', '-pk'] if newest_first else ['created_at', 'pk']
+    if keep is None:
+        return list(queryset.order_by(*ordering)[:limit])
+
+    after = older_than if newest_first else newer_than
+    batch_size = limit * KEEP_BATCH_FACTOR
+    rows = []
+    remaining = queryset
+    while len(rows) < limit:
+        batch = list(remaining.order_by(*ordering)[:batch_size])
+        rows.extend(keep(batch))
+        if len(batch) < batch_size:
+            break
+        remaining = after(queryset, batch[-1].created_at, batch[-1].pk)
+    return rows[:limit]
+
+
+def paginate_keyset(queryset, request, page_size=DEFAULT_PAGE_SIZE, keep=None):
+    """
+    Page a queryset newest first on (created_at, id) using the request's
+    ?after= / ?before= cursor. Any ordering on the queryset is replaced.
+
+    `keep` filters rows in Python where SQL cannot (see take_rows()); only
+    the rows around the page are checked, never the whole queryset.
+    """
+    after = decode_cursor(request.GET.get('after'))
+    before = None if after else decode_cursor(request.GET.get('before'))
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    query = params.urlencode()
+
+    if before:
+        # Walk backwards from the cursor, then flip the rows back to newest first
+        rows = take_rows(newer_than(queryset, *before), False, page_size + 1, keep)
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        return KeysetPage(
+            items,
+            next_cursor=encode_cursor(items[-1]) if items else None,
+            previous_cursor=encode_cursor(items[0]) if items and has_more else None,
+            query=query,
+        )
+
+    if after:
+        queryset = older_than(queryset, *after)
+    rows = take_rows(queryset, True, page_size + 1, keep)
+    items = rows[:page_size]
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if len(rows) > page_size else None,
+        previous_cursor=encode_cursor(items[0]) if items and after else None,
+        query=query,
+    )
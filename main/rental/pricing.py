@@ -0,0 +1,137 @@
+"""
+Rental price quoting.
+
+Prices are worked out in integer paise so a whole batch of quotes (a
+catalogue page, a cart, a checkout) is plain integer arithmetic: each
+product's rates are converted once, each window's duration once, and
+Decimal only comes back at the very end.
+
+A rental is charged the cheapest mix of whole weeks, whole days and
+pro-rata hours that covers it, so 10 days is a week plus 3 days (or two
+weeks, if that is cheaper) and 30 hours is a day plus 6 hours. A rate of
+zero means that unit is not offered. If nothing is offered, or the window
+is empty, the sales price is charged as before. Hourly amounts are rounded
+half up to the paisa, which is what the database does when a quote is
+stored in a unit_price column.
+
+Each product's rates (with any ProductVariant overrides) are compiled once
+into an immutable Tariff and cached in-process, keyed on the product's
+updated_at so a save anywhere makes the old table unreachable.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+
+PAISE_PER_RUPEE = 100
+HOUR = timedelta(hours=1) // timedelta(microseconds=1)
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# Compiled tariffs kept per process; cleared wholesale when it grows past this
+TARIFF_CACHE_SIZE = 10000
+
+_tariffs = {}
+
+
+class Tariff(NamedTuple):
+    """Compiled rates of one product (or variant), all in paise"""
+    units: tuple  # (span in microseconds, price) of offered whole units, longest first
+    hourly: int
+    sales: int
+
+
+def to_paise(amount):
+    """Decimal rupee amount -> int paise (None counts as 0)"""
+    return int((amount or 0) * PAISE_PER_RUPEE)
+
+
+def from_paise(paise):
+    """int paise -> Decimal rupees with two places"""
+    return Decimal(paise).scaleb(-2)
+
+
+def compile_tariff(product, variant=None):
+    """Build the Tariff of a product, honouring the variant's price overrides"""
+    if variant:
+        week, day, hour = variant.get_price_per_week(), variant.get_price_per_day(), variant.get_price_per_hour()
+    else:
+        week, day, hour = product.price_per_week, product.price_per_day, product.price_per_hour
+
+    units = tuple(
+        (span, to_paise(price)) for span, price in ((WEEK, week), (DAY, day))
+        if to_paise(price) > 0
+    )
+    return Tariff(units, to_paise(hour), to_paise(product.sales_price))
+
+
+def get_tariff(product, variant=None):
+    """Compiled Tariff of a product, from the in-process cache when possible"""
+    if product.pk is None:
+        return compile_tariff(product, variant)
+
+    key = (product.pk, variant.pk if variant else None, product.updated_at)
+    tariff = _tariffs.get(key)
+    if tariff is None:
+        if len(_tariffs) >= TARIFF_CACHE_SIZE:
+            _tariffs.clear()
+        tariff = _tariffs[key] = compile_tariff(product, variant)
+    return tariff
+
+
+def invalidate_tariffs(product_id):
+    """Drop this process's compiled tariffs of a product and its variants"""
+    # list() snapshots the keys, as other threads may add tariffs meanwhile
+    for key in [key for key in list(_tariffs) if key[0] == product_id]:
+        _tariffs.pop(key, None)
+
+
+def _cheapest_cover(units, hourly, remaining):
+    """Cheapest price covering `remaining` microseconds, or None if impossible"""
+    if remaining <= 0:
+        return 0
+    if not units:
+        if not hourly:
+            return None
+        # hourly * microseconds / microseconds-per-hour, rounded half up
+        return (2 * hourly * remaining + HOUR) // (2 * HOUR)
+
+    (span, price), rest = units[0], units[1:]
+    whole = remaining // span
+
+    # Only "none", "as many as fit" and "one more to cover the rest" can be cheapest
+    best = None
+    for count in {0, whole, whole + 1}:
+        cost = _cheapest_cover(rest, hourly, remaining - count * span)
+        if cost is not None and (best is None or count * price + cost < best):
+            best = count * price + cost
+    return best
+
+
+def quote_paise(tariff, duration):
+    """Price of one rental of the given duration, in paise"""
+    microseconds = duration // timedelta(microseconds=1)
+    if microseconds <= 0:
+        return tariff.sales
+
+    price = _cheapest_cover(tariff.units, tariff.hourly, microseconds)
+    return tariff.sales if price is None else price
+
+
+def quote_rental_prices(quotes):
+    """
+    Price many (product, start_date, end_date[, variant]) windows in one pass.
+
+    Returns a list of Decimal prices in the same order. Missing dates price
+    at 0.00, as before.
+    """
+    prices = []
+    for product, start_date, end_date, *variant in quotes:
+        if not start_date or not end_date:
+            prices.append(0)
+            continue
+
+        tariff = get_tariff(product, variant[0] if variant else None)
+        prices.append(quote_paise(tariff, end_date - start_date))
+
+    return [from_paise(paise) for paise in prices]
@@ -0,0 +1,88 @@
+"""
+Daily sales rollup behind the sales report.
+
+DailySalesRollup holds the orders placed per vendor, day and status, with
+their invoiced revenue. sales_report sums these rows, so a year-long report
+reads a few hundred rows instead of every order. Saving or deleting an
+order or invoice records the order's day as a ChangedSalesDay (see the
+signals in models.py). `manage.py rollup_daily_sales` then recomputes only
+those days, so the report is as fresh as the last run. Schedule it often,
+e.g. every few minutes. Days follow the site's TIME_ZONE.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ChangedSalesDay, DailySalesRollup, RentalOrder
+
+
+# Days recomputed per transaction when rebuilding everything
+REBUILD_CHUNK_DAYS = 31
+
+
+def mark_sales_days_changed(*moments):
+    """Queue the days of the given datetimes for the next rollup"""
+    days = {timezone.localdate(moment) for moment in moments if moment}
+    ChangedSalesDay.objects.bulk_create([ChangedSalesDay(date=day) for day in days])
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_sales_days(days):
+    """Replace the rollup rows of the given days with fresh totals from the orders"""
+    days = sorted(set(days))
+    if not days:
+        return
+    # A created_at range the (created_at, id) index can serve, narrowed to the exact days
+    totals = RentalOrder.objects.filter(
+        created_at__gte=start_of_day(days[0]),
+        created_at__lt=start_of_day(days[-1] + timedelta(days=1)),
+    ).annotate(day=TruncDate('created_at')).filter(day__in=days).order_by().values(
+        'vendor', 'day', 'status'
+    ).annotate(
+        order_count=Count('pk'),
+        invoice_count=Count('invoice'),
+        revenue=Sum('invoice__total_amount'),
+    )
+    DailySalesRollup.objects.filter(date__in=days).delete()
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            vendor_id=row['vendor'],
+            date=row['day'],
+            status=row['status'],
+            order_count=row['order_count'],
+            invoice_count=row['invoice_count'],
+            revenue=row['revenue'] or 0,
+        )
+        for row in totals
+    ])
+
+
+def rollup_changed_days():
+    """Recompute the days changed since the last run; returns them"""
+    with transaction.atomic():
+        # Only the changes seen here are cleared; ones committed meanwhile wait for the next run
+        changes = list(ChangedSalesDay.objects.select_for_update(skip_locked=True))
+        days = {change.date for change in changes}
+        rebuild_sales_days(days)
+        ChangedSalesDay.objects.filter(pk__in=[change.pk for change in changes]).delete()
+    return sorted(days)
+
+
+def rebuild_all_sales_days():
+    """Recompute the rollup for every day that has orders; returns the number of days"""
+    days = sorted(
+        RentalOrder.objects.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+    )
+    with transaction.atomic():
+        # Days that no longer have any orders
+        DailySalesRollup.objects.exclude(date__in=days).delete()
+    for start in range(0, len(days), REBUILD_CHUNK_DAYS):
+        with transaction.atomic():
+            rebuild_sales_days(days[start:start + REBUILD_CHUNK_DAYS])
+    return len(days)
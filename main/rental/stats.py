@@ -0,0 +1,240 @@
+"""
+Per-vendor dashboard counters and headline figures.
+
+VendorStats keeps one row per vendor with running totals of the dashboard
+figures: products, orders, active rentals, revenue received and revenue
+still pending, listed in the admin without counting anything. Each product,
+order and invoice change applies the difference it makes to its vendor's
+row, as an F() update in the same transaction (see the signals in models.py). Rows
+inserted with bulk_create skip those signals, so their callers pass them to
+add_to_stats(). `manage.py reconcile_vendor_stats` recomputes every row from
+scratch. Run it periodically to correct drift from writes that bypass
+signals, such as queryset.update().
+
+dashboard_figures() and reports_overview() gather the headline numbers of
+the two dashboards live, each in a single pass of conditional aggregates
+(Count/Sum with filter=). `manage.py benchmark_dashboard` compares them
+with the per-figure queries the dashboards used to run.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Func, Max, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Invoice, Product, RentalOrder, VendorStats
+
+
+STATS_FIELDS = ['total_products', 'total_orders', 'active_rentals', 'total_revenue', 'pending_revenue']
+
+PENDING_INVOICE_STATUSES = ['draft', 'sent']
+
+# Fields each model's figures are read from; instances loaded without them are not tracked
+TRACKED_FIELDS = {
+    Product: ['vendor_id'],
+    RentalOrder: ['vendor_id', 'status'],
+    Invoice: ['order_id', 'status', 'amount_paid', 'total_amount'],
+}
+
+
+def vendor_figures(instance):
+    """
+    (owner pk, {field: value}) that one product, order or invoice adds to the
+    counters. Products and orders are owned by their vendor; an invoice is
+    owned by its order and counts towards the order's vendor.
+    """
+    if isinstance(instance, Product):
+        return instance.vendor_id, {'total_products': 1}
+    if isinstance(instance, RentalOrder):
+        return instance.vendor_id, {
+            'total_orders': 1,
+            'active_rentals': 1 if instance.status == 'rented' else 0,
+        }
+    pending = instance.status in PENDING_INVOICE_STATUSES
+    return instance.order_id, {
+        'total_revenue': instance.amount_paid or Decimal('0.00'),
+        'pending_revenue': (instance.total_amount or Decimal('0.00')) if pending else Decimal('0.00'),
+    }
+
+
+def is_tracked(instance):
+    """False for instances loaded with .only()/.defer() missing the fields the figures need"""
+    return all(attname in instance.__dict__ for attname in TRACKED_FIELDS[type(instance)])
+
+
+def add_figures(vendor_id, figures):
+    """Add figures (negative to subtract) to a vendor's row, creating it for additions"""
+    figures = {field: value for field, value in figures.items() if value}
+    if vendor_id is None or not figures:
+        return
+    rows = VendorStats.objects.filter(vendor_id=vendor_id)
+    changes = {field: F(field) + value for field, value in figures.items()}
+    if rows.update(updated_at=timezone.now(), **changes):
+        return
+    # No row to take figures away from: the vendor is being deleted (its row
+    # goes first) or was never counted, and reconcile_vendor_stats settles the rest
+    if any(value < 0 for value in figures.values()):
+        return
+    VendorStats.objects.get_or_create(vendor_id=vendor_id)
+    rows.update(updated_at=timezone.now(), **changes)
+
+
+def owner_vendor(model, owner_id):
+    """The vendor whose row an owner's figures go to"""
+    if model is Invoice and owner_id is not None:
+        return RentalOrder.objects.filter(pk=owner_id).values_list('vendor_id', flat=True).first()
+    return owner_id
+
+
+def apply_stats_change(model, old, new):
+    """Replace an instance's old (owner, figures) with its new ones; either may be None"""
+    if old and new and old[0] == new[0]:
+        changes = {field: new[1][field] - old[1][field] for field in new[1]}
+        if any(changes.values()):
+            add_figures(owner_vendor(model, new[0]), changes)
+        return
+    if old:
+        add_figures(owner_vendor(model, old[0]), {field: -value for field, value in old[1].items()})
+    if new:
+        add_figures(owner_vendor(model, new[0]), new[1])
+
+
+def update_many_figures(totals):
+    """Add each vendor's figures ({vendor_id: {field: value}}) to their rows in one UPDATE"""
+    fields = {field for figures in totals.values() for field in figures}
+    changes = {
+        field: F(field) + Case(
+            *[When(vendor_id=vendor_id, then=Value(figures[field]))
+              for vendor_id, figures in totals.items() if field in figures],
+            default=Value(0),
+            output_field=VendorStats._meta.get_field(field),
+        )
+        for field in fields
+    }
+    VendorStats.objects.filter(vendor_id__in=totals).update(updated_at=timezone.now(), **changes)
+
+
+def add_to_stats(*instances):
+    """Count newly bulk-created products, orders and invoices, in two queries for any number of vendors"""
+    totals = defaultdict(lambda: defaultdict(int))
+    for instance in instances:
+        owner_id, figures = vendor_figures(instance)
+        instance._stats_figures = owner_id, figures
+        # Invoices passed here come with their order, so the vendor is known
+        vendor_id = instance.order.vendor_id if isinstance(instance, Invoice) else owner_id
+        for field, value in figures.items():
+            if value:
+                totals[vendor_id][field] += value
+    totals = {vendor_id: figures for vendor_id, figures in totals.items() if vendor_id is not None and figures}
+    if not totals:
+        return
+    # Rows for vendors counted for the first time, then every vendor's figures at once
+    VendorStats.objects.bulk_create([VendorStats(vendor_id=vendor_id) for vendor_id in totals], ignore_conflicts=True)
+    update_many_figures(totals)
+
+
+def recompute_vendor_stats():
+    """Rebuild every vendor's row from the products, orders and invoices; returns the rows that changed"""
+    with transaction.atomic():
+        # Hold off incremental updates while the totals are recounted
+        previous = {
+            stats.vendor_id: stats
+            for stats in VendorStats.objects.select_for_update()
+        }
+
+        # Vendors that have a row but nothing left to count go back to zero
+        totals = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+        totals.update({vendor_id: dict.fromkeys(STATS_FIELDS, 0) for vendor_id in previous})
+        for row in Product.objects.order_by().values('vendor').annotate(total_products=Count('pk')):
+            totals[row['vendor']]['total_products'] = row['total_products']
+        for row in RentalOrder.objects.filter(vendor__isnull=False).order_by().values('vendor').annotate(
+            total_orders=Count('pk'),
+            active_rentals=Count('pk', filter=Q(status='rented')),
+        ):
+            totals[row['vendor']].update(total_orders=row['total_orders'], active_rentals=row['active_rentals'])
+        for row in Invoice.objects.filter(order__vendor__isnull=False).order_by().values('order__vendor').annotate(
+            total_revenue=Sum('amount_paid'),
+            pending_revenue=Sum('total_amount', filter=Q(status__in=PENDING_INVOICE_STATUSES)),
+        ):
+            totals[row['order__vendor']].update(
+                total_revenue=row['total_revenue'] or Decimal('0.00'),
+                pending_revenue=row['pending_revenue'] or Decimal('0.00'),
+            )
+
+        now = timezone.now()
+        changed = [
+            VendorStats(vendor_id=vendor_id, updated_at=now, **figures)
+            for vendor_id, figures in totals.items()
+            if vendor_id not in previous or any(
+                getattr(previous[vendor_id], field) != value for field, value in figures.items()
+            )
+        ]
+        VendorStats.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['vendor'],
+            update_fields=STATS_FIELDS + ['updated_at'],
+        )
+    return len(changed)
+
+
+def urgent_returns_for(orders, now):
+    """Orders out on rent that are due back within a day or overdue, soonest first"""
+    # Range scan on the return_due_at partial index, no line joins
+    return orders.filter(
+        status__in=['picked_up', 'rented'],
+        return_due_at__lte=now + timedelta(hours=24)
+    ).order_by('return_due_at')
+
+
+def dashboard_figures(vendor, now):
+    """Headline numbers of the dashboard for a vendor (None for all vendors), in one query"""
+    orders = RentalOrder.objects.all()
+    products = Product.objects.all()
+    if vendor is not None:
+        orders = orders.filter(vendor=vendor)
+        products = products.filter(vendor=vendor)
+
+    # Each figure is a filtered aggregate over the orders and their invoice (at
+    # most one per order, so the join does not repeat orders). The product count
+    # is a scalar subquery, see reports_overview()
+    urgent = Q(status__in=['picked_up', 'rented'], return_due_at__lte=now + timedelta(hours=24))
+    product_count = Subquery(products.order_by().values(count=Func(F('pk'), function='COUNT')))
+    figures = orders.order_by().aggregate(
+        total_products=Coalesce(Max(product_count), product_count),
+        total_orders=Count('pk'),
+        active_rentals=Count('pk', filter=Q(status='rented')),
+        total_revenue=Sum('invoice__amount_paid'),
+        pending_revenue=Sum('invoice__total_amount', filter=Q(invoice__status__in=PENDING_INVOICE_STATUSES)),
+        urgent_returns_count=Count('pk', filter=urgent),
+        overdue_count=Count('pk', filter=urgent & Q(return_due_at__lt=now)),
+        approaching_count=Count('pk', filter=urgent & Q(return_due_at__gte=now)),
+    )
+    figures['total_revenue'] = figures['total_revenue'] or Decimal('0.00')
+    figures['pending_revenue'] = figures['pending_revenue'] or Decimal('0.00')
+    return figures
+
+
+def reports_overview(vendor):
+    """Overview numbers of the reports dashboard for a vendor (None for all vendors), in one query"""
+    orders = RentalOrder.objects.all()
+    products = Product.objects.filter(is_rentable=True)
+    if vendor is not None:
+        orders = orders.filter(vendor=vendor)
+        products = products.filter(vendor=vendor)
+
+    # aggregate() only takes aggregates, so the product count (a scalar subquery,
+    # evaluated once) goes through Max(); Coalesce covers a vendor with no orders
+    product_count = Subquery(products.order_by().values(count=Func(F('pk'), function='COUNT')))
+    overview = orders.order_by().aggregate(
+        total_orders=Count('pk'),
+        # An order has at most one invoice, so the join does not repeat orders
+        total_revenue=Sum('invoice__total_amount'),
+        active_customers=Count('customer', distinct=True),
+        active_products=Coalesce(Max(product_count), product_count),
+    )
+    overview['total_revenue'] = overview['total_revenue'] or Decimal('0.00')
+    return overview
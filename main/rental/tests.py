@@ -1,3 +1,490 @@
-from django.test import TestCase
+import copy
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from . import pricing
+from .availability import (
+    build_availability_timeline, find_shortages, get_availability_calendar, peak_concurrent_quantity,
+)
+from .models import (
+    DailySalesRollup, Job, OrderLine, Product, ProductVariant, Quotation, QuotationLine, RentalOrder, VendorStats,
+)
+
+
+def make_vendor(username='vendor'):
+    return User.objects.create_user(username=username, password='x', role='vendor')
+
+
+def make_customer(username='customer'):
+    return User.objects.create_user(username=username, password='x', role='customer')
+
+
+def failing_task():
+    raise RuntimeError('task failed')
+
+
+def noop_task():
+    pass
+
+
+def at(hours):
+    """A fixed moment plus some hours, to write booking windows compactly"""
+    return timezone.make_aware(datetime(2026, 11, 2, 9)) + timedelta(hours=hours)
+
+
+class VendorStatsTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.customer = make_customer()
+        self.product = Product.objects.create(
+            vendor=self.vendor, name='Camera', quantity_on_hand=5, price_per_day=Decimal('100.00')
+        )
+
+    def test_counts_follow_products_and_orders(self):
+        order = RentalOrder.objects.create(customer=self.customer, vendor=self.vendor)
+        stats = VendorStats.objects.get(vendor=self.vendor)
+        self.assertEqual((stats.total_products, stats.total_orders, stats.active_rentals), (1, 1, 0))
+
+        order.status = 'rented'
+        order.save()
+        stats.refresh_from_db()
+        self.assertEqual(stats.active_rentals, 1)
+
+    def test_vendor_with_products_and_orders_can_be_deleted(self):
+        now = timezone.now()
+        order = RentalOrder.objects.create(customer=self.customer)
+        OrderLine.objects.create(
+            order=order, product=self.product, quantity=1,
+            start_date=now, end_date=now + timedelta(days=1), unit_price=Decimal('100.00')
+        )
+
+        self.vendor.delete()
+
+        self.assertFalse(User.objects.filter(pk=self.vendor.pk).exists())
+        self.assertFalse(VendorStats.objects.exists())
+
+    def test_orders_outlive_their_vendor(self):
+        from .rollups import rollup_changed_days
+
+        order = RentalOrder.objects.create(customer=self.customer, vendor=self.vendor)
+        rollup_changed_days()
+
+        self.vendor.delete()
+
+        order.refresh_from_db()
+        self.assertIsNone(order.vendor_id)
+        # The vendor's rollup rows went with it; the order is counted again without a vendor
+        rollup_changed_days()
+        self.assertIsNone(DailySalesRollup.objects.get().vendor_id)
+
+
+class SalesReportTests(TestCase):
+    def test_customer_figures_cover_the_same_days_as_the_totals(self):
+        from .rollups import rollup_changed_days
+
+        vendor = make_vendor()
+        RentalOrder.objects.create(customer=make_customer(), vendor=vendor)
+        rollup_changed_days()
+
+        # end_date is parsed as midnight, but the report runs to the end of that day
+        today = timezone.localdate().isoformat()
+        self.client.force_login(vendor)
+        response = self.client.get(reverse('rental:sales_report'), {'start_date': today, 'end_date': today})
+
+        self.assertEqual(response.context['total_orders'], 1)
+        self.assertEqual(response.context['unique_customers'], 1)
+        self.assertEqual(len(response.context['top_customers']), 1)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            vendor=make_vendor(), name='Camera', quantity_on_hand=5, price_per_hour=Decimal('10.00'),
+            price_per_day=Decimal('100.00'), price_per_week=Decimal('500.00'), sales_price=Decimal('2000.00')
+        )
+        self.start = timezone.now()
+
+    def price(self, duration, variant=None):
+        return self.product.calculate_rental_price(self.start, self.start + duration, variant)
+
+    def test_ten_days_is_a_week_and_three_days(self):
+        self.assertEqual(self.price(timedelta(days=10)), Decimal('800.00'))
+
+    def test_thirty_hours_is_a_day_and_six_hours(self):
+        self.assertEqual(self.price(timedelta(hours=30)), Decimal('160.00'))
+
+    def test_whole_units_win_when_cheaper(self):
+        # 6 days by the day (600) cost more than a week
+        self.assertEqual(self.price(timedelta(days=6)), Decimal('500.00'))
+        # 20 hours by the hour (200) cost more than a day
+        self.assertEqual(self.price(timedelta(hours=20)), Decimal('100.00'))
+
+    def test_variant_overrides_the_product_rates(self):
+        variant = ProductVariant.objects.create(
+            product=self.product, name='Kit', sku='CAM-KIT', price_per_day=Decimal('80.00')
+        )
+
+        self.assertEqual(self.price(timedelta(hours=30), variant), Decimal('140.00'))
+        self.assertEqual(self.price(timedelta(hours=30)), Decimal('160.00'))
+
+    def test_saving_a_product_drops_its_tariffs(self):
+        self.price(timedelta(days=1))
+        self.assertTrue(any(key[0] == self.product.pk for key in pricing._tariffs))
+
+        self.product.price_per_day = Decimal('120.00')
+        self.product.save()
+
+        self.assertFalse(any(key[0] == self.product.pk for key in pricing._tariffs))
+        self.assertEqual(self.price(timedelta(days=1)), Decimal('120.00'))
+
+
+class PeakConcurrentQuantityTests(SimpleTestCase):
+    def test_overlapping_bookings_stack(self):
+        intervals = [(at(0), at(10), 2), (at(5), at(15), 3)]
+        self.assertEqual(peak_concurrent_quantity(intervals, at(0), at(20)), 5)
+
+    def test_bookings_that_never_overlap_count_once(self):
+        intervals = [(at(0), at(5), 2), (at(10), at(15), 3)]
+        self.assertEqual(peak_concurrent_quantity(intervals, at(0), at(20)), 3)
+
+    def test_back_to_back_bookings_do_not_stack(self):
+        intervals = [(at(0), at(5), 2), (at(5), at(10), 2)]
+        self.assertEqual(peak_concurrent_quantity(intervals, at(0), at(10)), 2)
+
+    def test_bookings_are_clipped_to_the_window(self):
+        intervals = [(at(0), at(5), 2), (at(4), at(10), 3)]
+        self.assertEqual(peak_concurrent_quantity(intervals, at(5), at(10)), 3)
+        self.assertEqual(peak_concurrent_quantity(intervals, at(10), at(20)), 0)
+
+
+class AvailableQuantityTests(TestCase):
+    def test_only_bookings_out_at_the_same_time_reduce_stock(self):
+        customer = make_customer()
+        product = Product.objects.create(
+            vendor=make_vendor(), name='Camera', quantity_on_hand=5, price_per_day=Decimal('100.00')
+        )
+        for status, start, end, quantity in [
+            ('confirmed', at(0), at(24), 2),
+            ('rented', at(48), at(72), 3),
+            ('cancelled', at(0), at(72), 5),
+        ]:
+            order = RentalOrder.objects.create(customer=customer, status=status)
+            OrderLine.objects.create(
+                order=order, product=product, quantity=quantity,
+                start_date=start, end_date=end, unit_price=Decimal('100.00')
+            )
+
+        self.assertEqual(product.get_available_quantity(at(0), at(72)), 2)
+        self.assertEqual(product.get_available_quantity(at(24), at(48)), 5)
+
+    def test_moving_a_line_frees_the_old_product(self):
+        vendor = make_vendor()
+        camera, lens = [
+            Product.objects.create(vendor=vendor, name=name, quantity_on_hand=2, price_per_day=Decimal('100.00'))
+            for name in ['Camera', 'Lens']
+        ]
+        order = RentalOrder.objects.create(customer=make_customer(), status='confirmed')
+        OrderLine.objects.create(
+            order=order, product=camera, quantity=2, start_date=at(0), end_date=at(24), unit_price=Decimal('100.00')
+        )
+        self.assertEqual(camera.get_available_quantity(at(0), at(24)), 0)
+
+        line = OrderLine.objects.get()
+        line.product = lens
+        line.save()
+
+        self.assertEqual(camera.get_available_quantity(at(0), at(24)), 2)
+        self.assertEqual(lens.get_available_quantity(at(0), at(24)), 0)
+
+
+class AvailabilityTimelineTests(SimpleTestCase):
+    def test_each_slot_shows_its_peak_booking(self):
+        intervals = [(at(2), at(26), 1), (at(10), at(12), 2), (at(26), at(50), 4)]
+        timeline = build_availability_timeline(5, intervals, at(0), at(72), timedelta(days=1))
+
+        self.assertEqual(timeline, [(at(0), 2), (at(24), 1), (at(48), 1)])
+
+    def test_partial_last_slot_and_no_bookings(self):
+        timeline = build_availability_timeline(3, [], at(0), at(5), timedelta(hours=2))
+
+        self.assertEqual(timeline, [(at(0), 3), (at(2), 3), (at(4), 3)])
+
+    def test_overbooking_shows_as_zero(self):
+        timeline = build_availability_timeline(1, [(at(0), at(1), 2)], at(0), at(2), timedelta(hours=1))
+
+        self.assertEqual(timeline, [(at(0), 0), (at(1), 1)])
+
+
+class AvailabilityCalendarTests(TestCase):
+    def test_new_booking_shows_in_the_cached_calendar(self):
+        product = Product.objects.create(
+            vendor=make_vendor(), name='Camera', quantity_on_hand=5, price_per_day=Decimal('100.00')
+        )
+        self.assertEqual(get_availability_calendar(product, at(0), 2), [(at(0), 5), (at(24), 5)])
+
+        order = RentalOrder.objects.create(customer=make_customer(), status='confirmed')
+        OrderLine.objects.create(
+            order=order, product=product, quantity=2,
+            start_date=at(30), end_date=at(40), unit_price=Decimal('100.00')
+        )
+
+        self.assertEqual(get_availability_calendar(product, at(0), 2), [(at(0), 5), (at(24), 3)])
+
+
+class FindShortagesTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            vendor=make_vendor(), name='Camera', quantity_on_hand=3, price_per_day=Decimal('100.00')
+        )
+        order = RentalOrder.objects.create(customer=make_customer(), status='confirmed')
+        OrderLine.objects.create(
+            order=order, product=self.product, quantity=1,
+            start_date=at(0), end_date=at(24), unit_price=Decimal('100.00')
+        )
+
+    def cart_line(self, start, end, quantity):
+        return QuotationLine(
+            product=self.product, quantity=quantity, start_date=start, end_date=end, unit_price=Decimal('100.00')
+        )
+
+    def test_lines_competing_for_the_last_units(self):
+        # Each line fits on its own, but with the booking they need four units at hour 12
+        lines = [self.cart_line(at(0), at(24), 1), self.cart_line(at(12), at(36), 2)]
+
+        shortages = find_shortages(lines, {self.product.pk: self.product})
+
+        self.assertEqual(shortages, [(self.product, 2)])
+
+    def test_lines_at_different_times_share_the_stock(self):
+        lines = [self.cart_line(at(0), at(24), 2), self.cart_line(at(24), at(48), 3)]
+
+        self.assertEqual(find_shortages(lines, {self.product.pk: self.product}), [])
+
+
+class QuotationTotalsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(vendor=make_vendor(), name='Camera', price_per_day=Decimal('100.00'))
+        self.cart = Quotation.objects.create(customer=make_customer())
+
+    def add_line(self, unit_price):
+        QuotationLine.objects.create(
+            quotation=self.cart, product=self.product, quantity=1,
+            start_date=at(0), end_date=at(24), unit_price=unit_price
+        )
+
+    def test_tax_rounds_half_paise_up(self):
+        # 18% of 0.25 is 0.045
+        self.add_line(Decimal('0.25'))
+
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.tax_amount, Decimal('0.05'))
+
+    def test_saving_a_stale_cart_keeps_the_totals(self):
+        self.add_line(Decimal('100.00'))
+
+        # Loaded before the line was added, as a view would have
+        self.cart.notes = 'Gift'
+        self.cart.save()
+
+        self.cart.refresh_from_db()
+        self.assertEqual(
+            (self.cart.notes, self.cart.subtotal, self.cart.tax_amount, self.cart.line_count),
+            ('Gift', Decimal('100.00'), Decimal('18.00'), 1)
+        )
+
+
+class ReturnDueAtTests(TestCase):
+    def test_saving_a_stale_order_keeps_the_due_date(self):
+        product = Product.objects.create(vendor=make_vendor(), name='Camera', price_per_day=Decimal('100.00'))
+        order = RentalOrder.objects.create(customer=make_customer())
+        OrderLine.objects.create(
+            order=order, product=product, quantity=1, start_date=at(0), end_date=at(24), unit_price=Decimal('100.00')
+        )
+
+        # Loaded before the line was added, as a view would have
+        order.status = 'confirmed'
+        order.save()
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.return_due_at), ('confirmed', at(24)))
+
+
+class DashboardFiguresTests(TestCase):
+    def test_headline_numbers_in_one_query(self):
+        from .models import Invoice
+        from .stats import dashboard_figures
+
+        vendor = make_vendor()
+        customer = make_customer()
+        Product.objects.create(vendor=vendor, name='Camera', price_per_day=Decimal('100.00'))
+        now = timezone.now()
+        for status, due_in_hours, paid in [('rented', -2, 100), ('rented', 5, 0), ('returned', -48, 50)]:
+            order = RentalOrder.objects.create(
+                customer=customer, vendor=vendor, status=status, return_due_at=now + timedelta(hours=due_in_hours)
+            )
+            Invoice.objects.create(
+                order=order, invoice_number=f'INV-{order.pk}', status='paid' if paid else 'sent',
+                security_deposit=Decimal('1000.00'), tax_rate=Decimal('18'), amount_paid=Decimal(paid)
+            )
+        RentalOrder.objects.create(customer=customer, vendor=make_vendor('other'))
+
+        with self.assertNumQueries(1):
+            figures = dashboard_figures(vendor, now)
+
+        self.assertEqual(figures, {
+            'total_products': 1,
+            'total_orders': 3,
+            'active_rentals': 2,
+            'total_revenue': Decimal('150.00'),
+            'pending_revenue': Decimal('1000.00'),
+            'urgent_returns_count': 2,
+            'overdue_count': 1,
+            'approaching_count': 1,
+        })
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        start = timezone.now()
+        self.products = [
+            Product.objects.create(vendor=vendor, name=f'Product {n}', price_per_day=Decimal('100.00'))
+            for n in range(20)
+        ]
+        # Distinct creation times, newest last
+        for n, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(created_at=start + timedelta(minutes=n))
+        self.newest_first = [product.pk for product in reversed(self.products)]
+
+    def page(self, keep=None, **params):
+        from .pagination import paginate_keyset
+        return paginate_keyset(Product.objects.all(), RequestFactory().get('/', params), page_size=3, keep=keep)
+
+    def test_keep_refills_pages_from_later_batches(self):
+        checked = []
+
+        def keep_even(batch):
+            checked.extend(batch)
+            return [product for product in batch if product.pk % 2 == 0]
+
+        wanted = [pk for pk in self.newest_first if pk % 2 == 0]
+        first = self.page(keep_even)
+        # Only the rows around the page were checked, not the whole table
+        self.assertLess(len(checked), len(self.products))
+
+        second = self.page(keep_even, after=first.next_cursor)
+        back = self.page(keep_even, before=second.previous_cursor)
+
+        self.assertEqual([product.pk for product in first], wanted[:3])
+        self.assertEqual([product.pk for product in second], wanted[3:6])
+        self.assertTrue(second.has_next)
+        self.assertEqual([product.pk for product in back], wanted[:3])
+
+    def test_without_keep(self):
+        first = self.page()
+        self.assertEqual([product.pk for product in first], self.newest_first[:3])
+        self.assertEqual(
+            [product.pk for product in self.page(after=first.next_cursor)], self.newest_first[3:6]
+        )
+
+
+class BlockAllocatorTests(TestCase):
+    def test_block_size_is_the_sequence_increment(self):
+        from django.db import connection
+        from .numbering import BlockAllocator
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT increment_by FROM pg_sequences WHERE sequencename = 'rental_order_number_seq'")
+            increment_by = cursor.fetchone()[0]
+        allocator = BlockAllocator('rental_order_number_seq')
+
+        first = allocator.allocate()
+        numbers = [first] + [allocator.allocate() for _ in range(increment_by - 1)]
+
+        self.assertEqual(allocator.block_size, increment_by)
+        self.assertEqual(numbers, list(range(first, first + increment_by)))
+
+    def test_two_allocators_never_share_a_number(self):
+        from .numbering import BlockAllocator
+
+        for sequence in ['rental_order_number_seq', 'rental_invoice_number_seq']:
+            allocators = [BlockAllocator(sequence), BlockAllocator(sequence)]
+            # Interleaved over several blocks each
+            numbers = [allocators[n % 2].allocate() for n in range(250)]
+            self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_forked_worker_does_not_reuse_the_parents_block(self):
+        from .numbering import BlockAllocator
+
+        parent = BlockAllocator('rental_invoice_number_seq')
+        parent.allocate()
+        # A forked child starts with a copy of the parent's state, under another pid
+        child = copy.copy(parent)
+        child.lock = threading.Lock()
+        with mock.patch('rental.numbering.os.getpid', return_value=parent.pid + 1):
+            child_numbers = [child.allocate() for _ in range(5)]
+        parent_numbers = [parent.allocate() for _ in range(5)]
+
+        self.assertFalse(set(child_numbers) & set(parent_numbers))
+
+
+class JobRetryTests(TestCase):
+    def test_failing_job_backs_off_then_gives_up(self):
+        from .jobs import enqueue, run_next_job
+
+        job = enqueue('rental.tests.failing_task')
+        delays = []
+        for _ in range(job.max_attempts):
+            # Make the retry due now, then time how far the next one is pushed out
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            started = timezone.now()
+            job = run_next_job()
+            delays.append(job.run_at - started)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertIn('task failed', job.last_error)
+        # Queued retries come later each time; the final failure is not rescheduled
+        retries = delays[:-1]
+        self.assertEqual(retries, sorted(retries))
+        self.assertGreater(retries[-1], retries[0])
+        self.assertGreaterEqual(retries[0], timedelta(seconds=30))
+        self.assertIsNone(run_next_job())
+
+
+class JobClaimTests(TransactionTestCase):
+    def test_job_locked_by_another_worker_is_skipped(self):
+        from django.db import connection, transaction
+        from .jobs import enqueue, run_next_job
+
+        first = enqueue('rental.tests.noop_task')
+        second = enqueue('rental.tests.noop_task')
+        locked, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            # Holds the row lock of the first job, as a worker running it would
+            with transaction.atomic():
+                Job.objects.select_for_update().get(pk=first.pk)
+                locked.set()
+                release.wait(10)
+            connection.close()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        self.assertTrue(locked.wait(10))
+        try:
+            claimed = run_next_job()
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertEqual(claimed.pk, second.pk)
+        self.assertEqual(claimed.status, 'done')
+        self.assertEqual(Job.objects.get(pk=first.pk).status, 'queued')
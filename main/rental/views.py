@@ -7,8 +7,9 @@ from django.db import models
 from decimal import Decimal
 from .models import (
     Product, ProductImage, RentalOrder, OrderLine, Invoice, Payment,
-    Pickup, Return, Category
+    Pickup, Return, Category, DailySalesRollup
 )
+from .pagination import paginate_keyset
 from .forms import (
     ProductForm, ProductImageForm, OrderStatusUpdateForm, PickupForm,
     ReturnForm, PaymentForm
@@ -24,45 +25,18 @@ def is_vendor_or_admin(user):
 @user_passes_test(is_vendor_or_admin)
 def dashboard(request):
     """Vendor/Admin dashboard with statistics"""
-    # Get user's products if vendor
+    from .stats import dashboard_figures, urgent_returns_for
+    
     if request.user.is_vendor():
-        products = Product.objects.filter(vendor=request.user)
-        orders = RentalOrder.objects.filter(lines__product__vendor=request.user).distinct()
+        vendor = request.user
+        orders = RentalOrder.objects.filter(vendor=vendor)
     else:
-        products = Product.objects.all()
+        vendor = None
         orders = RentalOrder.objects.all()
     
-    # Statistics
-    total_products = products.count()
-    total_orders = orders.count()
-    active_rentals = orders.filter(status='rented').count()
-    
-    # Revenue calculation
-    invoices = Invoice.objects.filter(order__in=orders)
-    total_revenue = invoices.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
-    pending_revenue = invoices.filter(status__in=['draft', 'sent']).aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0.00')
-    
-    # Urgent returns (approaching or overdue)
-    from django.utils import timezone
-    from datetime import timedelta
     now = timezone.now()
-    within_24h = now + timedelta(hours=24)
-    
-    urgent_returns = orders.filter(
-        status__in=['picked_up', 'rented']
-    ).filter(
-        models.Q(lines__end_date__lt=now) | 
-        models.Q(lines__end_date__lte=within_24h, lines__end_date__gte=now)
-    ).distinct()
-    
-    urgent_returns_count = urgent_returns.count()
-    overdue_count = urgent_returns.filter(lines__end_date__lt=now).distinct().count()
-    approaching_count = urgent_returns.filter(
-        lines__end_date__lte=within_24h, 
-        lines__end_date__gte=now
-    ).distinct().count()
+    figures = dashboard_figures(vendor, now)
+    urgent_returns = urgent_returns_for(orders, now)
     
     # Most rented products
     most_rented = OrderLine.objects.filter(
@@ -77,14 +51,7 @@ def dashboard(request):
     recent_orders = orders.order_by('-created_at')[:10]
     
     context = {
-        'total_products': total_products,
-        'total_orders': total_orders,
-        'active_rentals': active_rentals,
-        'total_revenue': total_revenue,
-        'pending_revenue': pending_revenue,
-        'urgent_returns_count': urgent_returns_count,
-        'overdue_count': overdue_count,
-        'approaching_count': approaching_count,
+        **figures,
         'urgent_returns': urgent_returns[:5],  # Show top 5 on dashboard
         'most_rented': most_rented,
         'recent_orders': recent_orders,
@@ -101,10 +68,8 @@ def product_manage(request):
     else:
         products = Product.objects.all()
     
-    products = products.order_by('-created_at')
-    
     context = {
-        'products': products,
+        'products': paginate_keyset(products, request),
     }
     return render(request, 'rental/product_manage.html', context)
 
@@ -249,73 +214,63 @@ def product_image_add(request, product_pk):
 @user_passes_test(is_vendor_or_admin)
 def order_manage(request):
     """Manage orders list"""
+    from datetime import timedelta
+    from django.db.models import Prefetch
+    from django.db.models.functions import Coalesce
+    
     if request.user.is_vendor():
-        orders = RentalOrder.objects.filter(
-            lines__product__vendor=request.user
-        ).distinct()
+        orders = RentalOrder.objects.filter(vendor=request.user)
     else:
         orders = RentalOrder.objects.all()
     
+    # Per-order line figures in the same query as the orders
+    orders = orders.annotate(
+        line_count=Count('lines'),
+        lines_total=Coalesce(
+            Sum(F('lines__unit_price') * F('lines__quantity')),
+            Decimal('0.00'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    )
+    
     # Filter by status
     status_filter = request.GET.get('status')
     if status_filter:
         orders = orders.filter(status=status_filter)
     
-    # Filter by return date urgency
+    # Filter by return date urgency (return_due_at is the latest line end date)
+    now = timezone.now()
+    within_24h = now + timedelta(hours=24)
+    active_orders = orders.filter(status__in=['picked_up', 'rented'])
     return_filter = request.GET.get('return_status')
     if return_filter == 'approaching':
         # Orders with return dates within 24 hours
-        from django.utils import timezone
-        from datetime import timedelta
-        now = timezone.now()
-        within_24h = now + timedelta(hours=24)
-        orders = orders.filter(
-            status__in=['picked_up', 'rented'],
-            lines__end_date__gte=now,
-            lines__end_date__lte=within_24h
-        ).distinct()
+        orders = active_orders.filter(return_due_at__gte=now, return_due_at__lte=within_24h)
     elif return_filter == 'overdue':
         # Orders with passed return dates
-        from django.utils import timezone
-        orders = orders.filter(
-            status__in=['picked_up', 'rented'],
-            lines__end_date__lt=timezone.now()
-        ).distinct()
+        orders = active_orders.filter(return_due_at__lt=now)
     elif return_filter == 'urgent':
         # Combined: approaching or overdue
-        from django.utils import timezone
-        from datetime import timedelta
-        now = timezone.now()
-        within_24h = now + timedelta(hours=24)
-        orders = orders.filter(
-            status__in=['picked_up', 'rented']
-        ).filter(
-            models.Q(lines__end_date__lt=now) | 
-            models.Q(lines__end_date__lte=within_24h, lines__end_date__gte=now)
-        ).distinct()
-    
-    orders = orders.order_by('-created_at')
+        orders = active_orders.filter(return_due_at__lte=within_24h)
+    
+    # Only the first two lines of each order are shown by name
+    orders = paginate_keyset(orders.select_related('customer').prefetch_related(
+        Prefetch(
+            'lines',
+            queryset=OrderLine.objects.select_related('product').order_by('order_id', 'pk')[:2],
+            to_attr='preview_lines'
+        )
+    ), request)
     
     # Count urgent returns for badge
     if request.user.is_vendor():
-        urgent_orders = RentalOrder.objects.filter(
-            lines__product__vendor=request.user,
-            status__in=['picked_up', 'rented']
-        ).distinct()
+        urgent_orders = RentalOrder.objects.filter(vendor=request.user)
     else:
-        urgent_orders = RentalOrder.objects.filter(
-            status__in=['picked_up', 'rented']
-        )
-    
-    from django.utils import timezone
-    from datetime import timedelta
-    now = timezone.now()
-    within_24h = now + timedelta(hours=24)
-    
+        urgent_orders = RentalOrder.objects.all()
     urgent_count = urgent_orders.filter(
-        models.Q(lines__end_date__lt=now) | 
-        models.Q(lines__end_date__lte=within_24h, lines__end_date__gte=now)
-    ).distinct().count()
+        status__in=['picked_up', 'rented'],
+        return_due_at__lte=within_24h
+    ).count()
     
     context = {
         'orders': orders,
@@ -334,8 +289,8 @@ def order_detail_manage(request, pk):
     
     # Check permission for vendors
     if request.user.is_vendor():
-        # Vendor can only see orders containing their products
-        if not order.lines.filter(product__vendor=request.user).exists():
+        # Vendor can only see their own orders
+        if order.vendor_id != request.user.pk:
             messages.error(request, 'You do not have permission to view this order.')
             return redirect('rental:order_manage')
     
@@ -514,27 +469,9 @@ def record_payment(request, invoice_id):
 @user_passes_test(is_vendor_or_admin)
 def reports_dashboard(request):
     """Main reports dashboard"""
-    from django.db.models import Sum
-    
-    # Get quick overview stats
-    if request.user.is_vendor():
-        orders = RentalOrder.objects.filter(lines__product__vendor=request.user).distinct()
-        products = Product.objects.filter(vendor=request.user, is_rentable=True)
-    else:
-        orders = RentalOrder.objects.all()
-        products = Product.objects.filter(is_rentable=True)
+    from .stats import reports_overview
     
-    total_orders = orders.count()
-    total_revenue = orders.aggregate(total=Sum('invoice__total_amount'))['total'] or Decimal('0.00')
-    active_customers = orders.values('customer').distinct().count()
-    active_products = products.count()
-    
-    context = {
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'active_customers': active_customers,
-        'active_products': active_products,
-    }
+    context = reports_overview(request.user if request.user.is_vendor() else None)
     return render(request, 'rental/reports_dashboard.html', context)
 
 
@@ -543,7 +480,8 @@ def reports_dashboard(request):
 def sales_report(request):
     """Sales report with filtering"""
     from datetime import datetime, timedelta
-    from django.db.models import Sum, Count, Avg
+    from django.db.models import Sum, Count
+    from .rollups import start_of_day
     
     # Get date range from request or default to last 30 days
     end_date = request.GET.get('end_date')
@@ -561,37 +499,41 @@ def sales_report(request):
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
         start_date = timezone.make_aware(start_date)
     
-    # Filter orders by user role
+    # The report covers whole local days. Totals come from the daily rollup
+    # (see rollups.py); customer figures still need the orders, over the same days
+    first_day = timezone.localdate(start_date)
+    last_day = timezone.localdate(end_date)
+    rollups = DailySalesRollup.objects.filter(date__gte=first_day, date__lte=last_day)
+    orders = RentalOrder.objects.filter(
+        created_at__gte=start_of_day(first_day),
+        created_at__lt=start_of_day(last_day + timedelta(days=1))
+    )
     if request.user.is_vendor():
-        orders = RentalOrder.objects.filter(
-            lines__product__vendor=request.user,
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).distinct()
-    else:
-        orders = RentalOrder.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        )
+        rollups = rollups.filter(vendor=request.user)
+        orders = orders.filter(vendor=request.user)
     
     # Calculate metrics
-    total_orders = orders.count()
-    total_revenue = orders.aggregate(total=Sum('invoice__total_amount'))['total'] or Decimal('0.00')
-    avg_order_value = orders.aggregate(avg=Avg('invoice__total_amount'))['avg'] or Decimal('0.00')
+    totals = rollups.aggregate(
+        total_orders=Sum('order_count'),
+        invoice_count=Sum('invoice_count'),
+        total_revenue=Sum('revenue')
+    )
+    total_orders = totals['total_orders'] or 0
+    total_revenue = totals['total_revenue'] or Decimal('0.00')
+    avg_order_value = Decimal('0.00')
+    if totals['invoice_count']:
+        avg_order_value = (total_revenue / totals['invoice_count']).quantize(Decimal('0.01'))
     
     # Orders by status
-    orders_by_status = orders.values('status').annotate(
-        count=Count('id'),
-        revenue=Sum('invoice__total_amount')
+    orders_by_status = rollups.values('status').annotate(
+        count=Sum('order_count'),
+        revenue=Sum('revenue')
     ).order_by('-count')
     
     # Daily sales trend
-    from django.db.models.functions import TruncDate
-    daily_sales = orders.annotate(
-        date=TruncDate('created_at')
-    ).values('date').annotate(
-        orders_count=Count('id'),
-        revenue=Sum('invoice__total_amount')
+    daily_sales = rollups.values('date').annotate(
+        orders_count=Sum('order_count'),
+        revenue=Sum('revenue')
     ).order_by('date')
     
     # Top customers
@@ -679,18 +621,17 @@ def product_report(request):
         rental_revenue=Sum(F('unit_price') * F('quantity'))
     ).order_by('-rental_count')[:20]
     
-    # Get product objects for most rented
-    most_rented = []
-    for item in most_rented_data:
-        product = products.filter(id=item['product__id']).first()
-        if product:
-            most_rented.append({
-                'name': item['product__name'],
-                'category': type('obj', (object,), {'name': item['product__category__name']})() if item['product__category__name'] else None,
-                'rental_count': item['rental_count'],
-                'rental_revenue': item['rental_revenue'] or Decimal('0.00'),
-                'stock': item['product__quantity_on_hand']
-            })
+    # The grouped rows already carry what the table shows (and only the user's products)
+    most_rented = [
+        {
+            'name': item['product__name'],
+            'category': {'name': item['product__category__name']} if item['product__category__name'] else None,
+            'rental_count': item['rental_count'],
+            'rental_revenue': item['rental_revenue'] or Decimal('0.00'),
+            'stock': item['product__quantity_on_hand']
+        }
+        for item in most_rented_data
+    ]
     
     # Category breakdown - rentals by category
     category_breakdown = order_lines.filter(
@@ -702,28 +643,38 @@ def product_report(request):
         revenue=Sum(F('unit_price') * F('quantity'))
     ).order_by('-rental_count')
     
-    # Low stock products with recent rentals
+    # Low stock products and the products for the utilization section
+    low_stock_products = list(
+        products.filter(quantity_on_hand__lte=5, is_rentable=True).select_related('category').order_by('quantity_on_hand')[:10]
+    )
+    utilization_products = list(products.filter(is_rentable=True)[:10])
+    
+    # Line figures for both lists in one grouped query, joined to the products in memory
     thirty_days_ago = timezone.now() - timedelta(days=30)
+    line_figures = {
+        row['product']: row
+        for row in order_lines.filter(
+            product__in=[product.pk for product in low_stock_products + utilization_products]
+        ).values('product').annotate(
+            recent_rentals=Count('id', filter=Q(order__created_at__gte=thirty_days_ago)),
+            currently_rented=Sum('quantity', filter=Q(order__status__in=['picked_up', 'rented']))
+        )
+    }
+    no_lines = {'recent_rentals': 0, 'currently_rented': None}
+    
     low_stock = []
-    for product in products.filter(quantity_on_hand__lte=5, is_rentable=True).order_by('quantity_on_hand')[:10]:
-        recent_rentals = order_lines.filter(
-            product=product,
-            order__created_at__gte=thirty_days_ago
-        ).count()
+    for product in low_stock_products:
         low_stock.append({
             'name': product.name,
             'category': product.category,
             'stock': product.quantity_on_hand,
-            'recent_rentals': recent_rentals
+            'recent_rentals': line_figures.get(product.pk, no_lines)['recent_rentals']
         })
     
     # Product utilization (simple version - currently rented)
     utilization = []
-    for product in products.filter(is_rentable=True)[:10]:
-        currently_rented = order_lines.filter(
-            product=product,
-            order__status__in=['picked_up', 'rented']
-        ).aggregate(total=Sum('quantity'))['total'] or 0
+    for product in utilization_products:
+        currently_rented = line_figures.get(product.pk, no_lines)['currently_rented'] or 0
         
         if product.quantity_on_hand > 0:
             utilization_rate = (currently_rented / product.quantity_on_hand) * 100
@@ -745,9 +696,14 @@ def product_report(request):
     category_labels = json.dumps([item['product__category__name'] or 'Uncategorized' for item in category_breakdown][:10])
     category_counts = json.dumps([item['rental_count'] for item in category_breakdown][:10])
     
+    product_counts = products.aggregate(
+        total=Count('pk'),
+        rentable=Count('pk', filter=Q(is_rentable=True))
+    )
+    
     context = {
-        'total_products': products.count(),
-        'rentable_products': products.filter(is_rentable=True).count(),
+        'total_products': product_counts['total'],
+        'rentable_products': product_counts['rentable'],
         'most_rented': most_rented,
         'category_breakdown': category_breakdown,
         'low_stock': low_stock,
@@ -770,7 +726,7 @@ def revenue_report(request):
     
     # Filter invoices by user role
     if request.user.is_vendor():
-        invoices = Invoice.objects.filter(order__lines__product__vendor=request.user).distinct()
+        invoices = Invoice.objects.filter(order__vendor=request.user)
     else:
         invoices = Invoice.objects.all()
     
@@ -800,7 +756,7 @@ def revenue_report(request):
     # Payment method breakdown
     payments = Payment.objects.all()
     if request.user.is_vendor():
-        payments = payments.filter(invoice__order__lines__product__vendor=request.user).distinct()
+        payments = payments.filter(invoice__order__vendor=request.user)
     
     payment_methods = payments.values('payment_method').annotate(
         count=Count('id'),
@@ -868,7 +824,7 @@ def customer_report(request):
     
     # Filter customers based on orders
     if request.user.is_vendor():
-        orders = RentalOrder.objects.filter(lines__product__vendor=request.user).distinct()
+        orders = RentalOrder.objects.filter(vendor=request.user)
     else:
         orders = RentalOrder.objects.all()
     
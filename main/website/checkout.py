@@ -0,0 +1,200 @@
+"""
+Checkout: turn a customer's draft cart into one rental order and invoice per vendor.
+
+The work is set based so the number of queries does not grow with the size
+of the cart. Products, variants and vendors are loaded up front, orders,
+lines and invoices are inserted with bulk_create, and stock is reduced with
+one grouped F() update per table, all in a single transaction.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from rental.availability import bump_availability_version, find_shortages
+from rental.rollups import mark_sales_days_changed
+from rental.stats import add_to_stats
+from rental.models import (
+    Invoice, OrderLine, Product, ProductVariant, Quotation, RentalOrder,
+    generate_invoice_number, generate_order_number, rental_period,
+)
+from .models import Coupon, CouponUsage
+
+
+TAX_RATE = Decimal('18.00')
+SECURITY_DEPOSIT = Decimal('1000.00')
+
+ORDER_DETAIL_FIELDS = [
+    'delivery_method', 'delivery_address', 'delivery_city',
+    'delivery_state', 'delivery_pincode', 'notes',
+]
+
+
+class CartAlreadyCheckedOut(Exception):
+    """The cart was confirmed by another request in the meantime"""
+
+
+class StockShortage(Exception):
+    """Some cart lines no longer fit; `shortages` lists (product, available)"""
+
+    def __init__(self, shortages):
+        super().__init__(', '.join(product.name for product, _ in shortages))
+        self.shortages = shortages
+
+
+def decrement_stock(model, quantities):
+    """Reduce quantity_on_hand of many rows in one UPDATE ({pk: quantity})"""
+    if not quantities:
+        return
+    model.objects.filter(pk__in=quantities).update(
+        quantity_on_hand=F('quantity_on_hand') - Case(
+            *[When(pk=pk, then=quantity) for pk, quantity in quantities.items()]
+        )
+    )
+
+
+def checkout_cart(cart_id, customer, order_details, coupon=None, security_deposit=SECURITY_DEPOSIT):
+    """
+    Place the orders for a draft cart and return them, first order first.
+
+    `order_details` holds the delivery fields and notes from CheckoutForm.
+    Raises CartAlreadyCheckedOut or StockShortage, in which case nothing has
+    been written.
+    """
+    with transaction.atomic():
+        # Lock the cart so a concurrent submit of the same cart waits here
+        cart = Quotation.objects.select_for_update().filter(pk=cart_id, status='draft').first()
+        if cart is None:
+            raise CartAlreadyCheckedOut()
+
+        # Lock the affected products in a stable order (avoids deadlocks
+        # between concurrent checkouts) and re-validate availability
+        cart_lines = list(cart.lines.select_related('product__vendor', 'variant').order_by('pk'))
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(
+                pk__in={line.product_id for line in cart_lines}
+            ).order_by('pk')
+        }
+        variants = {
+            variant.pk: variant
+            for variant in ProductVariant.objects.select_for_update().filter(
+                pk__in={line.variant_id for line in cart_lines if line.variant_id}
+            ).order_by('pk')
+        }
+        shortages = find_shortages(cart_lines, products, variants, exclude_quotation_id=cart.pk)
+        if shortages:
+            raise StockShortage(shortages)
+
+        # Group cart lines by vendor (vendors came with the lines)
+        vendor_lines = defaultdict(list)
+        for line in cart_lines:
+            vendor_lines[line.product.vendor_id].append(line)
+
+        subtotal = sum((line.get_total() for line in cart_lines), Decimal('0.00'))
+        discount_amount = Decimal('0.00')
+        if coupon:
+            discount_amount = (subtotal * coupon.discount_percentage / 100).quantize(Decimal('0.01'))
+
+        # One order per vendor; the first one is linked to the cart. return_due_at is
+        # set here because the bulk-created lines skip the signal that maintains it
+        orders = []
+        for vendor_id, lines in vendor_lines.items():
+            orders.append(RentalOrder(
+                customer=customer,
+                vendor_id=vendor_id,
+                quotation=None if orders else cart,
+                order_number=generate_order_number(),
+                status='pending',
+                return_due_at=max(line.end_date for line in lines),
+                **{field: order_details.get(field, '') for field in ORDER_DETAIL_FIELDS}
+            ))
+        RentalOrder.objects.bulk_create(orders)
+
+        # Copy cart lines to order lines; bulk_create skips save(), so fill period here
+        order_lines = []
+        product_stock = defaultdict(int)
+        variant_stock = defaultdict(int)
+        for order, lines in zip(orders, vendor_lines.values()):
+            for line in lines:
+                order_lines.append(OrderLine(
+                    order=order,
+                    product=line.product,
+                    variant=line.variant,
+                    quantity=line.quantity,
+                    start_date=line.start_date,
+                    end_date=line.end_date,
+                    period=rental_period(line.start_date, line.end_date),
+                    unit_price=line.unit_price
+                ))
+                # Variant lines draw from the variant's own stock
+                if line.variant_id:
+                    variant_stock[line.variant_id] += line.quantity
+                else:
+                    product_stock[line.product_id] += line.quantity
+        OrderLine.objects.bulk_create(order_lines)
+
+        # Reduce stock in SQL so concurrent updates are not lost
+        decrement_stock(Product, product_stock)
+        decrement_stock(ProductVariant, variant_stock)
+
+        # Split discount and deposit across vendors in proportion to their subtotals;
+        # the last vendor absorbs the discount's rounding difference
+        invoices = []
+        total_discount_distributed = Decimal('0.00')
+        for index, (order, lines) in enumerate(zip(orders, vendor_lines.values())):
+            vendor_subtotal = sum((line.get_total() for line in lines), Decimal('0.00'))
+
+            vendor_discount = Decimal('0.00')
+            if discount_amount > 0 and subtotal > 0:
+                vendor_discount = (discount_amount * vendor_subtotal / subtotal).quantize(Decimal('0.01'))
+                total_discount_distributed += vendor_discount
+            if index == len(orders) - 1:
+                vendor_discount += discount_amount - total_discount_distributed
+
+            vendor_security_deposit = Decimal('0.00')
+            if security_deposit > 0 and subtotal > 0:
+                vendor_security_deposit = (security_deposit * vendor_subtotal / subtotal).quantize(Decimal('0.01'))
+
+            # Rounded half up like the database rounds what Invoice.save() stores
+            vendor_subtotal_after_discount = vendor_subtotal - vendor_discount
+            vendor_tax = (vendor_subtotal_after_discount * TAX_RATE / 100).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+
+            invoices.append(Invoice(
+                order=order,
+                invoice_number=generate_invoice_number(),
+                subtotal=vendor_subtotal,
+                discount_amount=vendor_discount,
+                tax_rate=TAX_RATE,
+                tax_amount=vendor_tax,
+                security_deposit=vendor_security_deposit,
+                total_amount=vendor_subtotal_after_discount + vendor_tax + vendor_security_deposit
+            ))
+        Invoice.objects.bulk_create(invoices)
+
+        # bulk_create skips the signals that keep the dashboard counters and sales rollup
+        add_to_stats(*orders, *invoices)
+        mark_sales_days_changed(*(order.created_at for order in orders))
+
+        # Mark quotation as confirmed; its holds are now real order lines
+        cart.status = 'confirmed'
+        cart.save(update_fields=['status', 'updated_at'])
+        cart.lines.filter(hold_expires_at__isnull=False).update(hold_expires_at=None)
+
+        # Record coupon usage (linked to the first order)
+        if coupon:
+            CouponUsage.objects.create(
+                coupon=coupon,
+                user=customer,
+                order=orders[0],
+                discount_amount=discount_amount
+            )
+            Coupon.objects.filter(pk=coupon.pk).update(times_used=F('times_used') + 1)
+
+        # bulk_create skips the OrderLine signals, so drop cached availability once
+        bump_availability_version(*products)
+
+    return orders
@@ -218,3 +218,11 @@ def send_payment_confirmation_email(invoice):
         import traceback
         traceback.print_exc()
         return False
+
+
+def send_payment_confirmation_job(invoice_id):
+    """Job queue task (see rental/jobs.py): email the invoice, raising so failures are retried"""
+    from rental.models import Invoice
+    invoice = Invoice.objects.select_related('order__customer').get(pk=invoice_id)
+    if not send_payment_confirmation_email(invoice):
+        raise RuntimeError(f'Payment confirmation email for invoice {invoice.invoice_number} was not sent')
@@ -0,0 +1,97 @@
+"""
+Idempotency keys for POSTs that must not run twice (checkout, payment).
+
+The form carries a one-off key (hidden `idempotency_key` field, or an
+`Idempotency-Key` header from API clients). The first request with a key
+claims it. A repeat - double click, proxy retry - gets the original
+redirect back instead of placing the order or taking the payment again.
+A repeat that arrives while the first request is still running is sent
+to the pending page. Only successful outcomes are remembered; a request
+that fails releases its key so the customer can try again. A request that
+never finishes (worker killed) cannot release it, so its claim only lasts
+IDEMPOTENCY_CLAIM_LEASE_SECONDS; after that a repeat takes the key over.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+def new_idempotency_key():
+    """Fresh key for a form that should only be submitted once"""
+    return uuid.uuid4().hex
+
+
+def get_idempotency_digest(request):
+    """Digest identifying this request's key, or None if the client sent none"""
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    if not key:
+        return None
+    return hashlib.sha256(f'{request.user.pk}:{request.path}:{key}'.encode()).hexdigest()
+
+
+def remember_result(response):
+    """Mark a view's response as the outcome to replay for repeats of the request"""
+    response.idempotent_result = True
+    return response
+
+
+def idempotent_post(pending_url):
+    """
+    Make a POST view safe to retry.
+
+    The view marks its success response with remember_result(); anything
+    else (errors, re-rendered forms, exceptions) releases the key.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            digest = get_idempotency_digest(request) if request.method == 'POST' else None
+            if digest is None:
+                return view_func(request, *args, **kwargs)
+
+            now = timezone.now()
+            IdempotencyKey.objects.filter(digest=digest, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        digest=digest,
+                        claimed_at=now,
+                        expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+                    )
+            except IntegrityError:
+                # Seen before: replay the outcome, take over an abandoned claim,
+                # or wait for the first request
+                previous = IdempotencyKey.objects.filter(digest=digest).first()
+                if previous and previous.result_url:
+                    return redirect(previous.result_url)
+                lease_start = now - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_LEASE_SECONDS)
+                if not IdempotencyKey.objects.filter(
+                    digest=digest, result_url='', claimed_at__lte=lease_start
+                ).update(claimed_at=now):
+                    messages.info(request, 'Your previous request is still being processed.')
+                    return redirect(pending_url)
+
+            # Only this request's claim; a late finish must not touch a takeover's
+            claim = IdempotencyKey.objects.filter(digest=digest, claimed_at=now)
+            try:
+                response = view_func(request, *args, **kwargs)
+            except BaseException:
+                claim.delete()
+                raise
+
+            if getattr(response, 'idempotent_result', False) and response.has_header('Location'):
+                claim.update(result_url=response['Location'])
+            else:
+                claim.delete()
+            return response
+        return wrapper
+    return decorator
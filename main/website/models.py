@@ -76,3 +76,17 @@ class CouponUsage(models.Model):
     class Meta:
         ordering = ['-used_at']
         unique_together = ['coupon', 'user']
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a checkout/payment POST, so a retried request is answered without running again"""
+    # sha256 of user, path and the client's key - fixed size whatever the client sends
+    digest = models.CharField(max_length=64, primary_key=True)
+    # Where the original request redirected; empty while it is still running
+    result_url = models.CharField(max_length=255, blank=True)
+    # When the running request took the key; a claim older than the lease is abandoned
+    claimed_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return self.digest
@@ -1,3 +1,203 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from rental.models import Invoice, OrderLine, Product, Quotation, QuotationLine, RentalOrder, VendorStats
+from .checkout import StockShortage, checkout_cart
+from .idempotency import get_idempotency_digest
+from .models import IdempotencyKey
+
+
+class CartBulkAddTests(TestCase):
+    def setUp(self):
+        vendor = User.objects.create_user(username='vendor', password='x', role='vendor')
+        self.customer = User.objects.create_user(username='customer', password='x', role='customer')
+        self.product = Product.objects.create(
+            vendor=vendor, name='Camera', quantity_on_hand=5, price_per_day=Decimal('100.00')
+        )
+        self.client.force_login(self.customer)
+
+    def post_items(self, items):
+        return self.client.post(
+            reverse('website:cart_bulk_add'), json.dumps({'items': items}), content_type='application/json'
+        )
+
+    def test_non_string_dates_are_rejected(self):
+        response = self.post_items([
+            {'product': self.product.pk, 'quantity': 1, 'start_date': 20261020, 'end_date': ['2026-10-22']},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'Item 1: end date must be after start date')
+
+
+class CheckoutCartTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', password='x', role='customer')
+        self.cart = Quotation.objects.create(customer=self.customer, status='draft')
+        self.start = timezone.now() + timedelta(days=1)
+        self.products = [
+            Product.objects.create(
+                vendor=User.objects.create_user(username=f'vendor{n}', password='x', role='vendor'),
+                name=f'Camera {n}', quantity_on_hand=3, price_per_day=Decimal('100.00')
+            )
+            for n in range(2)
+        ]
+
+    def add_line(self, product, quantity):
+        QuotationLine.objects.create(
+            quotation=self.cart, product=product, quantity=quantity,
+            start_date=self.start, end_date=self.start + timedelta(days=1), unit_price=Decimal('100.00')
+        )
+
+    def test_one_order_and_invoice_per_vendor(self):
+        self.add_line(self.products[0], 2)
+        self.add_line(self.products[1], 1)
+
+        orders = checkout_cart(self.cart.pk, self.customer, {})
+
+        self.assertEqual({order.vendor_id for order in orders}, {product.vendor_id for product in self.products})
+        self.assertEqual(OrderLine.objects.count(), 2)
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(
+            [product.quantity_on_hand for product in Product.objects.order_by('pk')], [1, 2]
+        )
+        self.assertEqual(VendorStats.objects.get(vendor=self.products[0].vendor).total_orders, 1)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.status, 'confirmed')
+
+    def test_query_count_does_not_grow_with_vendors(self):
+        def checkout_queries(vendor_count):
+            cart = Quotation.objects.create(customer=self.customer, status='draft')
+            for n in range(vendor_count):
+                vendor = User.objects.create_user(username=f'many{vendor_count}-{n}', password='x', role='vendor')
+                QuotationLine.objects.create(
+                    quotation=cart, quantity=1, unit_price=Decimal('100.00'),
+                    product=Product.objects.create(
+                        vendor=vendor, name='Lens', quantity_on_hand=1, price_per_day=Decimal('100.00')
+                    ),
+                    start_date=self.start, end_date=self.start + timedelta(days=1)
+                )
+            with CaptureQueriesContext(connection) as queries:
+                checkout_cart(cart.pk, self.customer, {})
+            return len(queries)
+
+        self.assertEqual(checkout_queries(2), checkout_queries(10))
+        self.assertEqual(
+            set(VendorStats.objects.filter(vendor__username__startswith='many').values_list('total_orders', flat=True)),
+            {1}
+        )
+
+    def test_shortage_writes_nothing(self):
+        self.add_line(self.products[0], 1)
+        self.add_line(self.products[1], 4)
+
+        with self.assertRaises(StockShortage) as raised:
+            checkout_cart(self.cart.pk, self.customer, {})
+
+        self.assertEqual(raised.exception.shortages, [(self.products[1], 3)])
+        self.assertFalse(RentalOrder.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).quantity_on_hand, 3)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.status, 'draft')
+
+
+class CheckoutIdempotencyTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='customer', password='x', role='customer')
+        self.product = Product.objects.create(
+            vendor=User.objects.create_user(username='vendor', password='x', role='vendor'),
+            name='Camera', quantity_on_hand=3, price_per_day=Decimal('100.00')
+        )
+        start = timezone.now() + timedelta(days=1)
+        self.line = QuotationLine.objects.create(
+            quotation=Quotation.objects.create(customer=self.customer, status='draft'),
+            product=self.product, quantity=1,
+            start_date=start, end_date=start + timedelta(days=1), unit_price=Decimal('100.00')
+        )
+        self.client.force_login(self.customer)
+
+    def checkout(self, key):
+        return self.client.post(
+            reverse('website:checkout'), {'delivery_method': 'pickup', 'idempotency_key': key}
+        )
+
+    def test_repeated_submit_replays_the_first_outcome(self):
+        first = self.checkout('key-1')
+        # The cart is confirmed now, so only a replay can lead to the same page
+        second = self.checkout('key-1')
+
+        self.assertEqual(RentalOrder.objects.count(), 1)
+        self.assertRedirects(first, second['Location'], fetch_redirect_response=False)
+        self.assertEqual(IdempotencyKey.objects.get().result_url, first['Location'])
+
+    def test_failed_submit_releases_its_key(self):
+        self.line.quantity = 5
+        self.line.save()
+
+        response = self.checkout('key-1')
+
+        self.assertRedirects(response, reverse('website:cart'), fetch_redirect_response=False)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.line.quantity = 1
+        self.line.save()
+        self.checkout('key-1')
+        self.assertEqual(RentalOrder.objects.count(), 1)
+
+    def test_repeat_while_the_first_is_running_goes_to_the_pending_page(self):
+        self.checkout('key-1')
+        IdempotencyKey.objects.update(result_url='')
+
+        response = self.checkout('key-1')
+
+        self.assertRedirects(response, reverse('website:my_orders'), fetch_redirect_response=False)
+
+    def test_abandoned_claim_is_taken_over_after_the_lease(self):
+        # A worker killed mid-request leaves its claim behind with no result
+        request = RequestFactory().post(reverse('website:checkout'), {'idempotency_key': 'key-1'})
+        request.user = self.customer
+        lease = timedelta(seconds=settings.IDEMPOTENCY_CLAIM_LEASE_SECONDS)
+        IdempotencyKey.objects.create(
+            digest=get_idempotency_digest(request),
+            claimed_at=timezone.now() - lease - timedelta(seconds=1),
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+        response = self.checkout('key-1')
+
+        self.assertEqual(RentalOrder.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().result_url, response['Location'])
+
+
+class ProductListTests(TestCase):
+    def test_date_filter_hides_booked_products(self):
+        vendor = User.objects.create_user(username='vendor', password='x', role='vendor')
+        free, booked = [
+            Product.objects.create(vendor=vendor, name=name, quantity_on_hand=1, price_per_day=Decimal('100.00'))
+            for name in ['Free camera', 'Booked camera']
+        ]
+        start = timezone.now() + timedelta(days=1)
+        order = RentalOrder.objects.create(
+            customer=User.objects.create_user(username='customer', password='x', role='customer'), status='confirmed'
+        )
+        OrderLine.objects.create(
+            order=order, product=booked, quantity=1,
+            start_date=start, end_date=start + timedelta(days=2), unit_price=Decimal('100.00')
+        )
+
+        response = self.client.get(reverse('website:product_list'), {
+            'start': start.date().isoformat(), 'end': (start + timedelta(days=1)).date().isoformat()
+        })
+
+        self.assertEqual([product.pk for product in response.context['products']], [free.pk])
+        self.assertEqual(response.context['products'][0].available_quantity, 1)
+        self.assertEqual(response.context['products'][0].quoted_price, Decimal('100.00'))
@@ -7,7 +7,9 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('products/', views.product_list, name='product_list'),
     path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path('product/<int:pk>/availability/', views.product_availability, name='product_availability'),
     path('cart/', views.cart_view, name='cart'),
+    path('cart/bulk-add/', views.cart_bulk_add, name='cart_bulk_add'),
     path('checkout/', views.checkout_view, name='checkout'),
     path('orders/', views.my_orders, name='my_orders'),
     path('order/<int:pk>/', views.order_detail, name='order_detail'),
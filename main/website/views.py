@@ -1,12 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from decimal import Decimal
-from rental.models import Product, Quotation, QuotationLine, RentalOrder, OrderLine
+from datetime import datetime
+import json
+from rental.models import Product, ProductVariant, Quotation, QuotationLine, RentalOrder, rental_period
 from rental.forms import AddToCartForm, CheckoutForm
-from .models import Coupon, CouponUsage
+from rental.availability import bump_availability_version, find_shortages, get_hold_duration
+from rental.context_processors import get_cart_count, invalidate_cart_count
+from rental.pagination import paginate_keyset
+from rental.pricing import quote_rental_prices
+from .checkout import CartAlreadyCheckedOut, StockShortage, checkout_cart
+from .idempotency import idempotent_post, new_idempotency_key, remember_result
+from .models import Coupon
+
+
+def parse_rental_datetime(value):
+    """Parse a date or datetime GET parameter into an aware datetime (None if invalid)"""
+    # JSON bodies can carry numbers, lists or objects where a string is expected
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                return None
+            parsed = datetime.combine(parsed_date, datetime.min.time())
+    except ValueError:
+        return None
+    
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
 
 
 def home(request):
@@ -61,11 +96,36 @@ def product_list(request):
         except (ValueError, TypeError):
             pass
     
+    # Rental dates filter - only show products that are free for the whole window
+    start = parse_rental_datetime(request.GET.get('start'))
+    end = parse_rental_datetime(request.GET.get('end'))
+    if start and end and start < end:
+        from rental.availability import get_available_quantities
+        
+        def keep_available(batch):
+            # Only the rows read for this page are checked, not the whole catalogue
+            availability = get_available_quantities([product.pk for product in batch], start, end)
+            for product in batch:
+                product.available_quantity = availability.get(product.pk, 0)
+            return [product for product in batch if product.available_quantity > 0]
+        
+        products = paginate_keyset(products, request, keep=keep_available)
+        
+        # Price every listed product for the chosen window in one pass
+        prices = quote_rental_prices((product, start, end) for product in products)
+        for product, price in zip(products, prices):
+            product.quoted_price = price
+    else:
+        start = end = None
+        products = paginate_keyset(products, request)
+    
     context = {
         'products': products,
         'categories': categories,
         'selected_category': selected_category,
         'query': query,
+        'start': start,
+        'end': end,
     }
     return render(request, 'website/product_list.html', context)
 
@@ -86,10 +146,12 @@ def product_detail(request, pk):
             # Calculate price
             unit_price = product.calculate_rental_price(
                 form.cleaned_data['start_date'],
-                form.cleaned_data['end_date']
+                form.cleaned_data['end_date'],
+                variant=form.cleaned_data.get('variant')
             )
             
-            # Add to cart
+            # Add to cart, holding the stock for a while if cart holds are enabled
+            hold_duration = get_hold_duration()
             QuotationLine.objects.create(
                 quotation=cart,
                 product=product,
@@ -97,7 +159,8 @@ def product_detail(request, pk):
                 quantity=form.cleaned_data['quantity'],
                 start_date=form.cleaned_data['start_date'],
                 end_date=form.cleaned_data['end_date'],
-                unit_price=unit_price
+                unit_price=unit_price,
+                hold_expires_at=timezone.now() + hold_duration if hold_duration else None
             )
             
             messages.success(request, f'{product.name} added to cart!')
@@ -112,6 +175,50 @@ def product_detail(request, pk):
     return render(request, 'website/product_detail.html', context)
 
 
+def product_availability(request, pk):
+    """JSON availability calendar for the product page heatmap"""
+    from rental.availability import CALENDAR_STEPS, get_availability_calendar
+    
+    product = get_object_or_404(Product, pk=pk, publish_on_website=True)
+    
+    resolution = request.GET.get('resolution', 'day')
+    if resolution not in CALENDAR_STEPS:
+        return JsonResponse({'success': False, 'message': 'Resolution must be "day" or "hour"'}, status=400)
+    
+    try:
+        days = int(request.GET.get('days', 90))
+    except (ValueError, TypeError):
+        days = 90
+    days = max(1, min(days, 365))
+    
+    variant = None
+    variant_id = request.GET.get('variant', '')
+    if variant_id:
+        variant = product.variants.filter(pk=variant_id).first() if variant_id.isdigit() else None
+        if variant is None:
+            return JsonResponse({'success': False, 'message': 'Unknown variant'}, status=404)
+    
+    # Align the calendar to the current slot so cached entries can be shared
+    start = timezone.localtime()
+    start = start.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        start = start.replace(hour=0)
+    
+    slots = get_availability_calendar(product, start, days, resolution, variant)
+    
+    return JsonResponse({
+        'success': True,
+        'product': product.pk,
+        'variant': variant.pk if variant else None,
+        'resolution': resolution,
+        'quantity_on_hand': variant.quantity_on_hand if variant else product.quantity_on_hand,
+        'slots': [
+            {'start': slot_start.isoformat(), 'available': available}
+            for slot_start, available in slots
+        ],
+    })
+
+
 @login_required
 def cart_view(request):
     """Shopping cart / quotation view"""
@@ -138,16 +245,168 @@ def cart_view(request):
         messages.success(request, 'Item removed from cart.')
         return redirect('website:cart')
     
+    # Totals are stored on the cart and kept current as lines change
     context = {
         'cart': cart,
-        'subtotal': cart.get_total(),
-        'tax_amount': cart.get_tax_amount(),
-        'grand_total': cart.get_grand_total(),
+        'subtotal': cart.subtotal,
+        'tax_amount': cart.tax_amount,
+        'grand_total': cart.subtotal + cart.tax_amount,
     }
     return render(request, 'website/cart.html', context)
 
 
+# Most items one bulk add-to-cart request may carry
+BULK_ADD_MAX_ITEMS = 100
+
+
+@login_required
+def cart_bulk_add(request):
+    """
+    AJAX endpoint to add several products to the cart at once.
+    
+    Expects a JSON body {"items": [{"product", "variant", "quantity",
+    "start_date", "end_date"}, ...]}. Items for the same product, variant and
+    dates are merged (also into a matching cart line), availability is
+    checked for the whole batch in one pass and new lines are inserted with a
+    single bulk_create. Either every item is added or none is.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request method'}, status=405)
+    
+    if request.user.role != 'customer':
+        return JsonResponse({'success': False, 'message': 'Only customers can rent products'}, status=403)
+    
+    try:
+        items = json.loads(request.body)['items']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Expected a JSON body with an "items" list'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'success': False, 'message': 'Expected a JSON body with an "items" list'}, status=400)
+    if len(items) > BULK_ADD_MAX_ITEMS:
+        return JsonResponse({'success': False, 'message': f'At most {BULK_ADD_MAX_ITEMS} items per request'}, status=400)
+    
+    # Parse items and merge duplicates: (product, variant, start, end) -> quantity
+    requested = {}
+    for index, item in enumerate(items, start=1):
+        try:
+            product_id = int(item['product'])
+            variant_id = int(item['variant']) if item.get('variant') else None
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return JsonResponse({'success': False, 'message': f'Item {index}: product, variant and quantity must be numbers'}, status=400)
+        
+        start_date = parse_rental_datetime(item.get('start_date'))
+        end_date = parse_rental_datetime(item.get('end_date'))
+        if quantity < 1:
+            return JsonResponse({'success': False, 'message': f'Item {index}: quantity must be at least 1'}, status=400)
+        if not start_date or not end_date or start_date >= end_date:
+            return JsonResponse({'success': False, 'message': f'Item {index}: end date must be after start date'}, status=400)
+        
+        key = (product_id, variant_id, start_date, end_date)
+        requested[key] = requested.get(key, 0) + quantity
+    
+    product_ids = {product_id for product_id, _, _, _ in requested}
+    stock_keys = {(product_id, variant_id) for product_id, variant_id, _, _ in requested}
+    
+    with transaction.atomic():
+        # Lock the cart, then the products, in the same order as checkout
+        cart, created = Quotation.objects.get_or_create(customer=request.user, status='draft')
+        cart = Quotation.objects.select_for_update().get(pk=cart.pk)
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(
+                pk__in=product_ids, publish_on_website=True
+            ).order_by('pk')
+        }
+        variants = {
+            variant.pk: variant
+            for variant in ProductVariant.objects.select_for_update().filter(
+                pk__in={variant_id for _, variant_id in stock_keys if variant_id}
+            ).order_by('pk')
+        }
+        for product_id, variant_id in stock_keys:
+            if product_id not in products:
+                return JsonResponse({'success': False, 'message': f'Product {product_id} not found'}, status=404)
+            if variant_id and getattr(variants.get(variant_id), 'product_id', None) != product_id:
+                return JsonResponse({'success': False, 'message': f'Variant {variant_id} not found'}, status=404)
+        
+        cart_lines = [
+            line for line in cart.lines.filter(product_id__in=product_ids)
+            if (line.product_id, line.variant_id) in stock_keys
+        ]
+        existing = {
+            (line.product_id, line.variant_id, line.start_date, line.end_date): line
+            for line in cart_lines
+        }
+        
+        # Price every new window in one pass
+        hold_duration = get_hold_duration()
+        hold_expires_at = timezone.now() + hold_duration if hold_duration else None
+        prices = quote_rental_prices(
+            (products[product_id], start_date, end_date, variants.get(variant_id))
+            for product_id, variant_id, start_date, end_date in requested
+        )
+        
+        new_lines = []
+        merged_lines = []
+        for (key, quantity), unit_price in zip(requested.items(), prices):
+            line = existing.get(key)
+            if line:
+                line.quantity += quantity
+                line.hold_expires_at = hold_expires_at
+                merged_lines.append(line)
+                continue
+            
+            product_id, variant_id, start_date, end_date = key
+            # bulk_create skips save(), so the range column is filled here
+            new_lines.append(QuotationLine(
+                quotation=cart,
+                product=products[product_id],
+                variant=variants.get(variant_id),
+                quantity=quantity,
+                start_date=start_date,
+                end_date=end_date,
+                period=rental_period(start_date, end_date),
+                unit_price=unit_price,
+                hold_expires_at=hold_expires_at
+            ))
+        
+        # Check the cart's lines for these products together with the new ones
+        shortages = find_shortages(
+            cart_lines + new_lines, products, variants, exclude_quotation_id=cart.pk
+        )
+        if shortages:
+            return JsonResponse({
+                'success': False,
+                'message': '; '.join(
+                    f'Only {available} units of {product.name} are available for the selected dates'
+                    for product, available in shortages
+                ),
+            }, status=409)
+        
+        QuotationLine.objects.bulk_create(new_lines)
+        if merged_lines:
+            QuotationLine.objects.bulk_update(merged_lines, ['quantity', 'hold_expires_at'])
+        
+        # Bulk writes skip the QuotationLine signals, so do their work once here
+        cart.update_totals()
+        invalidate_cart_count(request.user.pk)
+        if hold_expires_at:
+            bump_availability_version(*product_ids)
+    
+    added = sum(requested.values())
+    return JsonResponse({
+        'success': True,
+        'message': f'{added} item(s) added to cart',
+        'added': added,
+        'line_count': cart.line_count,
+        'subtotal': str(cart.subtotal),
+        'cart_count': get_cart_count(request.user),
+    })
+
+
 @login_required
+@idempotent_post(pending_url='website:my_orders')
 def checkout_view(request):
     """Checkout and create order"""
     # Only customers can checkout
@@ -161,7 +420,7 @@ def checkout_view(request):
         status='draft'
     )
     
-    if not cart.lines.exists():
+    if not cart.line_count:
         messages.error(request, 'Your cart is empty.')
         return redirect('website:product_list')
     
@@ -176,13 +435,13 @@ def checkout_view(request):
             can_use, message = coupon.can_be_used_by(request.user)
             if can_use:
                 applied_coupon = coupon
-                subtotal = cart.get_total()
+                subtotal = cart.subtotal
                 discount_amount = (subtotal * coupon.discount_percentage / 100).quantize(Decimal('0.01'))
         except Coupon.DoesNotExist:
             del request.session['applied_coupon_code']
     
     # Calculate totals with discount
-    subtotal = cart.get_total()
+    subtotal = cart.subtotal
     subtotal_after_discount = subtotal - discount_amount
     tax_amount = (subtotal_after_discount * Decimal('18.00') / 100).quantize(Decimal('0.01'))
     security_deposit = Decimal('1000.00')
@@ -191,112 +450,21 @@ def checkout_view(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST, user=request.user)
         if form.is_valid():
-            # Group cart lines by vendor
-            from collections import defaultdict
-            vendor_lines = defaultdict(list)
-            for line in cart.lines.all():
-                vendor_lines[line.product.vendor].append(line)
-            
-            created_orders = []
-            total_discount_distributed = Decimal('0.00')
-            
-            # Calculate discount per vendor proportionally
-            if discount_amount > 0:
-                vendor_subtotals = {}
-                for vendor, lines in vendor_lines.items():
-                    vendor_subtotal = sum(line.get_total() for line in lines)
-                    vendor_subtotals[vendor] = vendor_subtotal
-            
-            # Create separate order and invoice for each vendor
-            for vendor, lines in vendor_lines.items():
-                # Create rental order for this vendor
-                order = RentalOrder()
-                order.customer = request.user
-                order.quotation = None  # Will link to original cart in first order only
-                order.status = 'pending'
-                order.delivery_method = form.cleaned_data['delivery_method']
-                order.delivery_address = form.cleaned_data.get('delivery_address', '')
-                order.delivery_city = form.cleaned_data.get('delivery_city', '')
-                order.delivery_state = form.cleaned_data.get('delivery_state', '')
-                order.delivery_pincode = form.cleaned_data.get('delivery_pincode', '')
-                order.notes = form.cleaned_data.get('notes', '')
-                order.save()
-                
-                # Copy quotation lines to order lines for this vendor
-                vendor_subtotal = Decimal('0.00')
-                for line in lines:
-                    OrderLine.objects.create(
-                        order=order,
-                        product=line.product,
-                        variant=line.variant,
-                        quantity=line.quantity,
-                        start_date=line.start_date,
-                        end_date=line.end_date,
-                        unit_price=line.unit_price
-                    )
-                    vendor_subtotal += line.get_total()
-                    
-                    # Reduce product quantity
-                    line.product.quantity_on_hand -= line.quantity
-                    line.product.save()
-                
-                # Calculate proportional discount for this vendor
-                vendor_discount = Decimal('0.00')
-                if discount_amount > 0 and subtotal > 0:
-                    discount_ratio = vendor_subtotal / subtotal
-                    vendor_discount = (discount_amount * discount_ratio).quantize(Decimal('0.01'))
-                    total_discount_distributed += vendor_discount
-                
-                # Adjust last vendor's discount to account for rounding
-                if vendor == list(vendor_lines.keys())[-1]:
-                    vendor_discount += (discount_amount - total_discount_distributed)
-                
-                # Calculate vendor-specific amounts
-                vendor_subtotal_after_discount = vendor_subtotal - vendor_discount
-                vendor_tax = (vendor_subtotal_after_discount * Decimal('18.00') / 100).quantize(Decimal('0.01'))
-                
-                # Security deposit split proportionally
-                vendor_security_deposit = Decimal('0.00')
-                if security_deposit > 0 and subtotal > 0:
-                    deposit_ratio = vendor_subtotal / subtotal
-                    vendor_security_deposit = (security_deposit * deposit_ratio).quantize(Decimal('0.01'))
-                
-                vendor_total = vendor_subtotal_after_discount + vendor_tax + vendor_security_deposit
-                
-                # Create invoice for this vendor's order
-                from rental.models import Invoice
-                invoice = Invoice.objects.create(
-                    order=order,
-                    subtotal=vendor_subtotal,
-                    discount_amount=vendor_discount,
-                    tax_rate=Decimal('18.00'),
-                    tax_amount=vendor_tax,
-                    security_deposit=vendor_security_deposit,
-                    total_amount=vendor_total
+            try:
+                created_orders = checkout_cart(
+                    cart.pk, request.user, form.cleaned_data, coupon=applied_coupon,
+                    security_deposit=security_deposit
                 )
-                
-                created_orders.append(order)
+            except CartAlreadyCheckedOut:
+                messages.info(request, 'This cart has already been checked out.')
+                return redirect('website:my_orders')
+            except StockShortage as shortage:
+                for product, available in shortage.shortages:
+                    messages.error(request, f'Only {available} units of {product.name} are available for the selected dates.')
+                return redirect('website:cart')
             
-            # Link first order to quotation
-            if created_orders:
-                created_orders[0].quotation = cart
-                created_orders[0].save()
-            
-            # Mark quotation as confirmed
-            cart.status = 'confirmed'
-            cart.save()
-            
-            # Record coupon usage if applied (link to first order)
-            if applied_coupon and created_orders:
-                CouponUsage.objects.create(
-                    coupon=applied_coupon,
-                    user=request.user,
-                    order=created_orders[0],
-                    discount_amount=discount_amount
-                )
-                applied_coupon.times_used += 1
-                applied_coupon.save()
-                # Clear coupon from session
+            # Clear coupon from session once it has been used
+            if applied_coupon:
                 del request.session['applied_coupon_code']
             
             # Store order IDs and invoice IDs in session for confirmation page
@@ -308,9 +476,9 @@ def checkout_view(request):
                 order_numbers = ', '.join([o.order_number for o in created_orders])
                 messages.success(request, f'{len(created_orders)} orders created successfully: {order_numbers}')
             
-            # Redirect to payment page for first invoice
+            # Redirect to payment page for first invoice (replayed for retries of this submit)
             first_invoice = created_orders[0].invoice
-            return redirect('website:payment', invoice_id=first_invoice.pk)
+            return remember_result(redirect('website:payment', invoice_id=first_invoice.pk))
     else:
         form = CheckoutForm(user=request.user)
     
@@ -324,6 +492,7 @@ def checkout_view(request):
         'tax_amount': tax_amount,
         'security_deposit': security_deposit,
         'grand_total': grand_total,
+        'idempotency_key': new_idempotency_key(),
     }
     return render(request, 'website/checkout.html', context)
 
@@ -331,7 +500,7 @@ def checkout_view(request):
 @login_required
 def my_orders(request):
     """Customer's orders list"""
-    orders = RentalOrder.objects.filter(customer=request.user).order_by('-created_at')
+    orders = paginate_keyset(RentalOrder.objects.filter(customer=request.user), request)
     
     context = {
         'orders': orders,
@@ -593,10 +762,11 @@ def invoice_pdf_download(request, pk):
 
 
 @login_required
+@idempotent_post(pending_url='website:my_orders')
 def payment_view(request, invoice_id):
     """Razorpay payment page (dummy mode)"""
     from rental.models import Invoice, Payment
-    from .email_utils import send_payment_confirmation_email
+    from rental.jobs import enqueue
     import random
     invoice = get_object_or_404(Invoice, pk=invoice_id, order__customer=request.user)
     
@@ -624,12 +794,11 @@ def payment_view(request, invoice_id):
             order.status = 'confirmed'
             order.save()
             
-            # Send confirmation email with invoice
-            email_sent = send_payment_confirmation_email(invoice)
-            if email_sent:
-                messages.success(request, 'Confirmation email sent to your registered email address.')
+            # Email the invoice from the job queue so a slow mail server can't hold up the response
+            enqueue('website.email_utils.send_payment_confirmation_job', invoice_id=invoice.pk)
+            messages.success(request, 'A confirmation email with your invoice will be sent to your registered email address.')
         
-        return redirect('website:payment_success', invoice_id=invoice.pk)
+        return remember_result(redirect('website:payment_success', invoice_id=invoice.pk))
     
     # Generate dummy Razorpay order ID
     razorpay_order_id = f'order_{random.randint(100000000000, 999999999999)}'
@@ -639,6 +808,7 @@ def payment_view(request, invoice_id):
         'amount_to_pay': invoice.get_balance(),
         'razorpay_order_id': razorpay_order_id,
         'razorpay_key': 'rzp_test_dummy123456',  # Dummy key for display
+        'idempotency_key': new_idempotency_key(),
     }
     return render(request, 'website/payment.html', context)
 
@@ -698,7 +868,7 @@ def validate_coupon(request):
     # Get cart to calculate discount
     try:
         cart = Quotation.objects.get(customer=request.user, status='draft')
-        subtotal = cart.get_total()
+        subtotal = cart.subtotal
         discount_amount = (subtotal * coupon.discount_percentage / 100).quantize(Decimal('0.01'))
         subtotal_after_discount = subtotal - discount_amount
         tax_amount = (subtotal_after_discount * Decimal('18.00') / 100).quantize(Decimal('0.01'))
@@ -734,8 +904,8 @@ def remove_coupon(request):
     # Recalculate totals without coupon
     try:
         cart = Quotation.objects.get(customer=request.user, status='draft')
-        subtotal = cart.get_total()
-        tax_amount = (subtotal * Decimal('18.00') / 100).quantize(Decimal('0.01'))
+        subtotal = cart.subtotal
+        tax_amount = cart.tax_amount
         security_deposit = Decimal('1000.00')
         grand_total = subtotal + tax_amount + security_deposit
         